@@ -0,0 +1,133 @@
+"""
+module author: Andrew Stucki
+
+Per-user access cache, so checking a login costs one keyed lookup
+instead of loading the configuration or every user's access tables.
+The cache is rebuilt next to the configuration file and swapped in
+with a rename whenever the configuration file changes.
+"""
+
+import os
+import errno
+import marshal
+import sqlite3
+
+from svndae import snapshot, util
+from svndae.acl import AccessMatrix
+
+_VERSION = 2
+
+_SCHEMA = (
+  'CREATE TABLE access (user TEXT PRIMARY KEY, everywhere INTEGER NOT NULL, row BLOB NOT NULL)',
+  'CREATE TABLE meta (name TEXT PRIMARY KEY, value BLOB)',
+)
+
+def get_cache_path(path,):
+  """
+  Returns where the access cache of a configuration file is kept
+  """
+  return '%s.access' % path
+
+def write_access_cache(path,matrix,stamp,):
+  """
+  Stores the rows of an AccessMatrix compiled from the configuration
+  file at path, when it had the given stamp. Readers see either the
+  old or the new cache.
+  """
+  (repos,rows,everywhere) = matrix.get_tables()
+  with util.replace_file(get_cache_path(path)) as tmp:
+    db = util.connect_db(tmp)
+    try:
+      for statement in _SCHEMA:
+        db.execute(statement)
+      db.execute('BEGIN')
+      db.executemany('INSERT INTO meta VALUES (?, ?)',[
+        ('version',buffer(marshal.dumps(_VERSION))),
+        ('stamp',buffer(marshal.dumps(stamp))),
+        ('repos',buffer(marshal.dumps(repos))),
+        ])
+      users = set(rows)
+      users.update(everywhere)
+      db.executemany('INSERT INTO access VALUES (?, ?, ?)',[
+        (user,everywhere.get(user,0),buffer(marshal.dumps(rows.get(user,{}))))
+        for user in users
+        ])
+      db.execute('COMMIT')
+    finally:
+      db.close()
+
+def read_cache_stamp(path,):
+  """
+  Returns the stamp of the configuration file at path the access cache
+  was compiled from, or None when there is no usable cache.
+  """
+  cache = get_cache_path(path)
+  if not os.path.exists(cache):
+    return None
+  db = util.connect_db(cache)
+  try:
+    try:
+      meta = dict(db.execute('SELECT name, value FROM meta').fetchall())
+    except sqlite3.DatabaseError:
+      return None
+  finally:
+    db.close()
+  try:
+    if marshal.loads(str(meta['version'])) != _VERSION:
+      return None
+    return marshal.loads(str(meta['stamp']))
+  except (KeyError,EOFError,ValueError,TypeError):
+    return None
+
+def read_user_access(path,user,):
+  """
+  Returns an AccessMatrix holding only the access of user, from the
+  cache of the configuration file at path, or None when there is no
+  cache or it is out of date.
+  """
+  cache = get_cache_path(path)
+  try:
+    stamp = snapshot.get_stamp(path)
+  except OSError, e:
+    if e.errno == errno.ENOENT:
+      return None
+    raise
+  if not os.path.exists(cache):
+    return None
+  db = util.connect_db(cache)
+  try:
+    try:
+      meta = dict(db.execute('SELECT name, value FROM meta').fetchall())
+      row = db.execute('SELECT everywhere, row FROM access WHERE user = ?',(user,)).fetchone()
+    except sqlite3.DatabaseError:
+      return None
+  finally:
+    db.close()
+  try:
+    if marshal.loads(str(meta['version'])) != _VERSION:
+      return None
+    if marshal.loads(str(meta['stamp'])) != stamp:
+      return None
+    repos = marshal.loads(str(meta['repos']))
+  except (KeyError,EOFError,ValueError,TypeError):
+    return None
+  if row is None:
+    return AccessMatrix(repos)
+  return AccessMatrix(repos,{user: marshal.loads(str(row[1]))},{user: row[0]})
+
+def update_access_cache(config,):
+  """
+  Compiles the access tables of a SvndaeConfig and stores them in the
+  access cache of its file, unless the cache was already compiled from
+  this version of the file. Returns whether the cache was rewritten.
+  """
+  path = config.get_full_path()
+  stamp = config.get_stamp()
+  if read_cache_stamp(path) == stamp:
+    return False
+  matrix = config.get_access_matrix()
+  # only trust the cache if nobody changed the file meanwhile
+  if snapshot.get_stamp(path) != stamp:
+    return False
+  write_access_cache(path,matrix,stamp)
+  return True
@@ -0,0 +1,112 @@
+"""
+module author: Andrew Stucki
+"""
+
+READ = 1
+WRITE = 2
+MODES = {'read': READ, 'write': WRITE}
+
+class AccessMatrix:
+  """
+  Compiled access table mapping every user to the repositories they may
+  read or write, stored as bitmasks. Write permissions grant read access
+  too. Permissions granted on '@all' are kept as a single mask per user.
+  """
+
+  def compile(class_,config,):
+    """
+    Class method that builds the table for every user of a SvndaeConfig
+    """
+    matrix = class_(config.repos.keys())
+    users = set()
+    for (name,group) in config.groups.items():
+      for repos in group.get_permissions().values():
+        if repos:
+          users.update(config.expand_group_membership(name))
+          break
+    matrix.update_users(config,users)
+    return matrix
+  compile = classmethod(compile)
+
+  def __init__(self,repos=(),rows=None,everywhere=None,):
+    """
+    Initialization method, rows maps users to {repo: mask} and
+    everywhere maps users to the mask granted on every repository.
+    """
+    self.__repos = set(repos)
+    self.__rows = rows or {}
+    self.__all = everywhere or {}
+
+  # Public instance methods
+
+  def can(self,user,repo,mode,):
+    """
+    Returns whether user may access repo in the given mode,
+    'read' or 'write'.
+    """
+    if repo not in self.__repos:
+      return False
+    mask = self.__all.get(user,0)
+    row = self.__rows.get(user)
+    if row:
+      mask |= row.get(repo,0)
+    return bool(mask & MODES[mode])
+
+  def get_repos(self,user,mode=None,):
+    """
+    Returns the repositories user may access in the given mode, or in
+    any mode.
+    """
+    if mode is None:
+      bits = READ | WRITE
+    else:
+      bits = MODES[mode]
+    if self.__all.get(user,0) & bits:
+      return sorted(self.__repos)
+    row = self.__rows.get(user,{})
+    return sorted([repo for (repo,mask) in row.items() if mask & bits and repo in self.__repos])
+
+  def get_tables(self,):
+    """
+    Returns the (repos, rows, everywhere) tables the matrix was built
+    from, suitable for passing back to the initializer.
+    """
+    return (sorted(self.__repos),self.__rows,self.__all)
+
+  def update_users(self,config,users,):
+    """
+    Recompiles the rows of the given users from a SvndaeConfig.
+    """
+    # write access implies read access, as in the exported authz file
+    modes = ((config._READ,READ),(config._WRITE,READ | WRITE))
+    for user in users:
+      row = {}
+      everywhere = 0
+      for name in config.expand_user_membership(user):
+        perms = config.groups[name].get_permissions()
+        for (type,bit) in modes:
+          for repo in perms.get(type,()):
+            if repo == config._ALL_REPOS:
+              everywhere |= bit
+            else:
+              row[repo] = row.get(repo,0) | bit
+      if row:
+        self.__rows[user] = row
+      else:
+        self.__rows.pop(user,None)
+      if everywhere:
+        self.__all[user] = everywhere
+      else:
+        self.__all.pop(user,None)
+
+  def add_repo(self,repo,):
+    """
+    Adds a repository, '@all' permissions apply to it right away.
+    """
+    self.__repos.add(repo)
+
+  def remove_repo(self,repo,):
+    """
+    Removes a repository, left over permissions on it are ignored.
+    """
+    self.__repos.discard(repo)
@@ -0,0 +1,161 @@
+"""
+module author: Andrew Stucki
+
+Exports a SvndaeConfig as an authz file, so svnserve (authz-db in
+svnserve.conf) and mod_authz_svn (AuthzSVNAccessFile) enforce access
+themselves, e.g.
+
+  [groups]
+  devs = alice, @qa
+  qa = bob
+
+  [/]
+  @admins = rw
+
+  [trunk:/]
+  @devs = rw
+
+svndae-sync also writes the svnserve configuration svndae-filter runs
+svnserve with, using the authz file and the repository root.
+"""
+
+import os
+import logging
+
+from svndae import util
+
+log = logging.getLogger('svndae.app')
+
+COMMENT = '### autogenerated by svndae, DO NOT EDIT'
+
+def _flattened_groups(config,):
+  """
+  Returns the groups that are part of, or contain, a circular reference,
+  authz files reject those so they are written with every member.
+  """
+  pending = {}
+  parents = {}
+  for (name,group) in config.groups.items():
+    children = [child for child in group.get_groups() if child in config.groups]
+    pending[name] = len(children)
+    for child in children:
+      parents.setdefault(child,[]).append(name)
+  # peel off groups whose subgroups are all done, what is left loops
+  todo = [name for (name,count) in pending.items() if not count]
+  while todo:
+    name = todo.pop()
+    del pending[name]
+    for parent in parents.get(name,()):
+      pending[parent] -= 1
+      if not pending[parent]:
+        todo.append(parent)
+  return set(pending)
+
+def _authz_repo_names(config,):
+  """
+  Returns {repo: name in the authz file}. svnserve names a repository
+  after its directory, so with a repository root the name comes from
+  the path, relative paths being below the root. Repositories outside
+  of the root are left out with a warning, svnserve does not serve them.
+  """
+  root = config.get_svnroot()
+  names = {}
+  for (name,repo) in config.repos.items():
+    if root is None or not repo.path:
+      names[name] = name
+      continue
+    path = os.path.normpath(os.path.join(root,repo.path))
+    if not path.startswith(os.path.join(os.path.normpath(root),'')):
+      log.warning("The repository '%s' at '%s' is not below '%s', leaving it out of the authz file", name, repo.path, root)
+      continue
+    names[name] = os.path.basename(path)
+  return names
+
+def generate_authz(config,):
+  """
+  Returns the lines of the authz file for a SvndaeConfig. Permissions on
+  '@all' go to the [/] section and write access is written as rw.
+  References to non-existant groups and repositories are left out.
+  """
+  flattened = _flattened_groups(config)
+  repos = _authz_repo_names(config)
+  lines = [COMMENT,'[groups]']
+  rules = {}
+  for name in sorted(config.groups.keys()):
+    group = config.groups[name]
+    if name in flattened:
+      members = sorted(config.expand_group_membership(name))
+    else:
+      members = list(group.get_direct_members())
+      members.extend(['@%s' % child for child in group.get_groups() if child in config.groups])
+    lines.append('%s = %s' % (name,', '.join(members)))
+    perms = group.get_permissions()
+    for (type,mode) in ((config._READ,'r'),(config._WRITE,'rw')):
+      for repo in perms.get(type,()):
+        if repo == config._ALL_REPOS:
+          section = '/'
+        elif repo in repos:
+          section = '%s:/' % repos[repo]
+        else:
+          continue
+        # rw wins over r
+        if rules.setdefault(section,{}).get(name) != 'rw':
+          rules[section][name] = mode
+  for section in sorted(rules):
+    lines.append('')
+    lines.append('[%s]' % section)
+    for name in sorted(rules[section]):
+      lines.append('@%s = %s' % (name,rules[section][name]))
+  return lines
+
+def generate_svnserve_conf(authz,root,):
+  """
+  Returns the lines of an svnserve configuration file enforcing the
+  authz file, for repositories below root. svnserve ignores the
+  [svndae] section, svndae-filter reads the root from it.
+  """
+  return [
+    COMMENT,
+    '[general]',
+    'anon-access = none',
+    'auth-access = write',
+    'authz-db = %s' % os.path.abspath(authz),
+    '',
+    '[svndae]',
+    'root = %s' % os.path.abspath(root),
+    ]
+
+def write_authz(path,config,):
+  """
+  Writes the authz file for a SvndaeConfig to path through a temporary
+  file and a rename, leaving it alone when nothing changed. Returns
+  whether path was rewritten.
+  """
+  return _write_lines(path,generate_authz(config))
+
+def write_svnserve_conf(path,authz,root,):
+  """
+  Writes the svnserve configuration file for an authz file and a
+  repository root to path, like write_authz.
+  """
+  return _write_lines(path,generate_svnserve_conf(authz,root))
+
+def _write_lines(path,lines,):
+  """
+  Replaces path by the given lines through a temporary file and a
+  rename, unless it already holds them. Returns whether it did.
+  """
+  text = ''.join(['%s\n' % line for line in lines])
+  try:
+    f = open(path,'rb')
+  except IOError:
+    pass
+  else:
+    try:
+      if f.read() == text:
+        return False
+    finally:
+      f.close()
+  with util.write_file(path) as out:
+    out.write(text)
+  return True
@@ -0,0 +1,272 @@
+"""
+module author: Andrew Stucki
+
+Times the expensive operations on synthetic data, e.g.
+
+  svndae-benchmark --users 10000 --groups 500 --depth 5 --save baseline.json
+  svndae-benchmark --users 10000 --groups 500 --depth 5 --compare baseline.json
+
+Each benchmark runs in a child process of its own, so its peak memory
+is not hidden by the benchmarks that ran before it.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import struct
+import marshal
+import logging
+import binascii
+import optparse
+import resource
+import tempfile
+import traceback
+
+from svndae import ssh
+from svndae.config import SvndaeConfig
+
+log = logging.getLogger('svndae.app')
+
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_QUERIES = 10000
+
+class BenchmarkError(Exception):
+  """
+  A benchmark failed in its child process
+  """
+
+def _make_key(number,):
+  """
+  Returns a valid ed25519 public key line unique to number
+  """
+  type = 'ssh-ed25519'
+  blob = struct.pack('>I',len(type)) + type + struct.pack('>I',32) + ('%032d' % number)
+  return '%s %s user%d@bench' % (type,binascii.b2a_base64(blob).rstrip('\n'),number)
+
+def generate_config(path,keydir,users=1000,groups=50,depth=3,repos=20,):
+  """
+  Writes a configuration file with users spread over groups, the groups
+  nested in chains of depth groups and each granted access to two of
+  the repos. The first group gets read access to every repository.
+  """
+  lines = ['[svndae]','keydir = %s' % keydir,'']
+  for group in range(groups):
+    members = ['user%d' % user for user in range(group,users,groups)]
+    if depth > 1 and group % depth != depth - 1 and group + 1 < groups:
+      members.append('@group%d' % (group + 1))
+    lines.append('[group group%d]' % group)
+    lines.append('members = %s' % ' '.join(members))
+    lines.append('write = repo%d' % (group % repos))
+    if group == 0:
+      lines.append('read = @all')
+    else:
+      lines.append('read = repo%d' % ((group + 1) % repos))
+    lines.append('')
+  for repo in range(repos):
+    lines.append('[repo repo%d]' % repo)
+    lines.append('path = /srv/svn/repo%d' % repo)
+    lines.append('')
+  out = open(path,'w')
+  try:
+    out.write('\n'.join(lines))
+  finally:
+    out.close()
+
+def generate_keydir(keydir,keys=1000,):
+  """
+  Writes keys public key files, one for each of user0 to user<keys-1>
+  """
+  for user in range(keys):
+    out = open(os.path.join(keydir,'user%d.pub' % user),'w')
+    try:
+      out.write('%s\n' % _make_key(user))
+    finally:
+      out.close()
+
+def get_peak_memory():
+  """
+  Returns the peak resident memory of the process so far, in kilobytes.
+  A forked child starts counting from the memory it inherited in use.
+  """
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    peak //= 1024
+  return peak
+
+def measure(func,ops,):
+  """
+  Calls func once in a child process, returns {seconds, ops,
+  ops_per_sec, peak_kb} where func performs ops operations and peak_kb
+  is the peak memory of the child. Changes func makes in memory are
+  lost, changes to files are kept.
+  """
+  (read_fd,write_fd) = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    status = 1
+    try:
+      try:
+        os.close(read_fd)
+        started = time.time()
+        func()
+        seconds = time.time() - started
+        out = os.fdopen(write_fd,'wb')
+        out.write(marshal.dumps((seconds,get_peak_memory())))
+        out.close()
+        status = 0
+      except:
+        traceback.print_exc()
+    finally:
+      # leave the parent's atexit handlers and buffers alone
+      os._exit(status)
+  os.close(write_fd)
+  f = os.fdopen(read_fd,'rb')
+  try:
+    data = f.read()
+  finally:
+    f.close()
+  (_,status) = os.waitpid(pid,0)
+  if status or not data:
+    raise BenchmarkError("The benchmark %s failed!" % getattr(func,'__name__',func))
+  (seconds,peak) = marshal.loads(data)
+  seconds = max(seconds,1e-9)
+  return {
+    'seconds': seconds,
+    'ops': ops,
+    'ops_per_sec': ops / seconds,
+    'peak_kb': peak,
+    }
+
+def run_benchmarks(directory,users=1000,groups=50,depth=3,repos=20,queries=DEFAULT_QUERIES,workers=None,keys=None,):
+  """
+  Generates data in directory and times loading, membership expansion,
+  permission queries, clean_config and syncing authorized_keys from a
+  keydir of keys key files, one per user by default.
+  Returns {name: measurement}.
+  """
+  if keys is None:
+    keys = users
+  keydir = os.path.join(directory,'keydir')
+  if not os.path.isdir(keydir):
+    os.mkdir(keydir)
+  conf = os.path.join(directory,'svndae.conf')
+  generate_config(conf,keydir,users,groups,depth,repos)
+  generate_keydir(keydir,keys)
+  results = {}
+  results['load'] = measure(lambda: SvndaeConfig(directory),1)
+  results['load_lazy'] = measure(lambda: SvndaeConfig(directory,lazy=True),1)
+  # set up in this process what the following benchmarks start from
+  cfg = SvndaeConfig(directory)
+  def expand():
+    for group in cfg.groups.keys():
+      cfg.expand_group_membership(group)
+  results['expand'] = measure(expand,groups)
+  rng = random.Random(0)
+  checks = [('user%d' % rng.randrange(users),'repo%d' % rng.randrange(repos),rng.choice(('read','write'))) for _ in range(queries)]
+  def access():
+    for (user,repo,type) in checks:
+      cfg.has_access(user,repo,type)
+  results['compile_access'] = measure(cfg.get_access_matrix,1)
+  cfg.get_access_matrix()
+  results['has_access'] = measure(access,queries)
+  results['clean_config'] = measure(lambda: cfg.clean_config(dry_run=True),groups)
+  authorized_keys = os.path.join(directory,'authorized_keys')
+  manifest = os.path.join(keydir,ssh.MANIFEST)
+  def sync():
+    ssh.writeAuthorizedKeys(authorized_keys,keydir,manifest=manifest,workers=workers,normalize=True)
+  results['sync'] = measure(sync,keys)
+  results['sync_unchanged'] = measure(sync,keys)
+  return results
+
+def compare(results,baseline,threshold=DEFAULT_THRESHOLD,):
+  """
+  Returns (name, measurement, baseline value, value) for the benchmarks
+  that got slower ('ops_per_sec') or used more memory ('peak_kb') than
+  baseline by more than threshold, a fraction.
+  """
+  regressions = []
+  for name in sorted(results):
+    if name not in baseline:
+      continue
+    before = baseline[name].get('ops_per_sec')
+    after = results[name]['ops_per_sec']
+    if before is not None and after < before * (1 - threshold):
+      regressions.append((name,'ops_per_sec',before,after))
+    before = baseline[name].get('peak_kb')
+    after = results[name].get('peak_kb')
+    if before is not None and after is not None and after > before * (1 + threshold):
+      regressions.append((name,'peak_kb',before,after))
+  return regressions
+
+class App(object):
+  name = None
+
+  def run(class_):
+    app = class_()
+    return app.main()
+  run = classmethod(run)
+
+  def main(self):
+    self.setup_basic_logging()
+    log.setLevel(logging.INFO)
+    parser = self.create_parser()
+    (options, args) = parser.parse_args()
+    if args:
+      parser.error('no arguments expected')
+    directory = tempfile.mkdtemp(prefix='svndae-benchmark-')
+    try:
+      results = run_benchmarks(
+        directory,options.users,options.groups,options.depth,
+        options.repos,options.queries,options.workers,options.keys,
+        )
+    finally:
+      shutil.rmtree(directory)
+    for name in sorted(results):
+      result = results[name]
+      sys.stdout.write('%-16s %12.1f ops/sec %10.4f s %10d KB peak\n' % (name,result['ops_per_sec'],result['seconds'],result['peak_kb']))
+    if options.save:
+      out = open(options.save,'w')
+      try:
+        json.dump(results,out,indent=2,sort_keys=True)
+      finally:
+        out.close()
+    if options.compare:
+      f = open(options.compare)
+      try:
+        baseline = json.load(f)
+      finally:
+        f.close()
+      regressions = compare(results,baseline,options.threshold)
+      for (name,measurement,before,after) in regressions:
+        log.warning('%s regressed from %.1f to %.1f %s', name, before, after, measurement)
+      if regressions:
+        return 1
+    return 0
+
+  def setup_basic_logging(self):
+    logging.basicConfig()
+
+  def create_parser(self):
+    parser = optparse.OptionParser()
+    parser.set_defaults(
+      users=1000,
+      groups=50,
+      depth=3,
+      repos=20,
+      queries=DEFAULT_QUERIES,
+      threshold=DEFAULT_THRESHOLD,
+    )
+    parser.add_option('--users',metavar='N',type='int',help='number of users',)
+    parser.add_option('--keys',metavar='S',type='int',help='number of key files, defaults to one per user',)
+    parser.add_option('--groups',metavar='M',type='int',help='number of groups',)
+    parser.add_option('--depth',metavar='D',type='int',help='length of the chains of nested groups',)
+    parser.add_option('--repos',metavar='K',type='int',help='number of repositories',)
+    parser.add_option('--queries',metavar='Q',type='int',help='number of permission checks',)
+    parser.add_option('-j','--workers',metavar='N',type='int',help='read key files with N threads',)
+    parser.add_option('--save',metavar='PATH',help='store the results as a baseline',)
+    parser.add_option('--compare',metavar='PATH',help='compare the results with a baseline, exits with 1 on regressions',)
+    parser.add_option('--threshold',metavar='FRACTION',type='float',help='how much slower than the baseline counts as a regression',)
+    return parser
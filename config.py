@@ -3,11 +3,20 @@ module author: Andrew Stucki
 """
 
 import os
+import re
+import errno
+import fcntl
+import contextlib
 import ConfigParser
+from cStringIO import StringIO
 
-from svndae import util
+from svndae import util, stats
+from svndae.acl import AccessMatrix, MODES
 from svndae.group import Group
-from svndae.repository import Repo
+from svndae.membership import MembershipIndex, MembershipReport
+from svndae.references import ReferenceIndex
+from svndae.repository import Repo, RepoTrie
+from svndae.snapshot import get_stat_stamp
 
 class SvndaeConfigError(Exception):
   """
@@ -39,6 +48,104 @@ class NonExistantRepositoryError(SvndaeConfigError):
   Bad Repository name specified
   """
 
+class ConfigConflictError(SvndaeConfigError):
+  """
+  Configuration File was changed by someone else since it was read
+  """
+
+class ConfigTransactionError(SvndaeConfigError):
+  """
+  Operation not allowed while a transaction is open
+  """
+
+_SECTION_RE = re.compile(r'^\[(?P<header>[^]]+)\]',re.M)
+_OPTION_RE = re.compile(r'^(?P<option>[^:=\s][^:=]*?)\s*[:=]')
+
+class CleanReport:
+  """
+  Lists the repairs clean_config made, or would make on a dry run:
+  (group, subgroup) references to non-existant groups, (group, type,
+  repo) permissions on non-existant repositories and (group, field)
+  fields missing from group sections.
+  """
+
+  def __init__(self,):
+    """
+    Initialization method
+    """
+    self.subgroups = []
+    self.permissions = []
+    self.fields = []
+
+  def __nonzero__(self,):
+    return bool(self.subgroups or self.permissions or self.fields)
+
+class _LazySections(dict):
+  """
+  Dictionary of Group or Repo objects, each created from its section
+  the first time it is looked up.
+  """
+
+  def __init__(self,names,load,):
+    dict.__init__(self)
+    self.__pending = set(names)
+    self.__load = load
+
+  def __missing__(self,name,):
+    if name not in self.__pending:
+      raise KeyError(name)
+    self.__pending.discard(name)
+    value = self.__load(name)
+    dict.__setitem__(self,name,value)
+    return value
+
+  def __contains__(self,name,):
+    return name in self.__pending or dict.__contains__(self,name)
+  has_key = __contains__
+
+  def __setitem__(self,name,value,):
+    self.__pending.discard(name)
+    dict.__setitem__(self,name,value)
+
+  def __delitem__(self,name,):
+    if name in self.__pending:
+      self.__pending.discard(name)
+    else:
+      dict.__delitem__(self,name)
+
+  def __len__(self,):
+    return dict.__len__(self) + len(self.__pending)
+
+  def __iter__(self,):
+    return iter(self.keys())
+  iterkeys = __iter__
+
+  def get(self,name,default=None,):
+    if name in self:
+      return self[name]
+    return default
+
+  def keys(self,):
+    return dict.keys(self) + list(self.__pending)
+
+  def items(self,):
+    self.__load_all()
+    return dict.items(self)
+
+  def values(self,):
+    self.__load_all()
+    return dict.values(self)
+
+  def iteritems(self,):
+    return iter(self.items())
+
+  def itervalues(self,):
+    return iter(self.values())
+
+  def __load_all(self,):
+    for name in list(self.__pending):
+      self[name]
+
 class SvndaeConfig:
   """
   Class for describing and interacting with the project configuration file.
@@ -49,6 +156,9 @@ class SvndaeConfig:
   _READ = "read"
   _KEYDIR = "keydir"
   _KEYFILE = "authorized_keys"
+  _KEYINDEX = "keyindex"
+  _AUTHZ = "authz"
+  _SVNROOT = "svnroot"
   _DEFAULT_CONF = "svndae.conf"
   _ALL_REPOS = "@all"
 
@@ -72,38 +182,150 @@ class SvndaeConfig:
     new_cfg.write(open(os.path.join(path,name),'w'))
   generate_config = classmethod(generate_config)
 
-  def __init__(self,path,name=None,):
+  def __init__(self,path,name=None,lazy=False,):
     """
     Initialization function, sets up Groups and Repositories as defined
-    in the configuration file.
+    in the configuration file. With lazy, each Group and Repo is only
+    set up when first used, and missing fields are not written back.
     """
     if name is None:
       name = self._DEFAULT_CONF
     self.path = path
     self.name = name
+    self.__lazy = lazy
+    self.__snapshots = []
+    self.__load()
+
+  # Public instance methods
+
+  def reload(self,):
+    """
+    Reads the configuration file again, dropping changes that were not
+    written, e.g. after a ConfigConflictError.
+    """
+    if self.__snapshots:
+      raise ConfigTransactionError("The configuration file can not be reloaded inside of a transaction!")
+    self.__load()
+
+  def update(self,func,retries=3,):
+    """
+    Calls func(config) inside of a transaction and returns its result.
+    If another process changed the configuration file in the meantime,
+    reloads it and calls func again, up to retries more times.
+    """
+    while True:
+      try:
+        with self.transaction():
+          return func(self)
+      except ConfigConflictError:
+        if retries <= 0:
+          raise
+        retries -= 1
+        self.reload()
+
+  def get_stamp(self,):
+    """
+    Returns what identifies the version of the configuration file this
+    object was loaded from or last wrote.
+    """
+    return self.__stamp
+
+  def __load(self,text=None,):
+    """
+    Reads the configuration file, or the given text of its current
+    version, and sets up Groups and Repositories.
+    """
     self.groups = {}
     self.repos = {}
+    self.__dirty = set()
+    self.__membership = None
+    self.__access = None
+    self.__references = None
+    self.__paths = None
     self.__config = ConfigParser.RawConfigParser()
-    if not self.__config.read(self.get_full_path()):
-      raise ConfigPathError("Unable to find the configuration file: '%s'!" % self.get_full_path())
+    if text is None:
+      try:
+        (text,self.__stamp) = self.__read_file()
+      except IOError:
+        raise ConfigPathError("Unable to find the configuration file: '%s'!" % self.get_full_path())
+    stats.incr('config.loads')
+    with stats.timer('config.parse'):
+      self.__config.readfp(StringIO(text),self.get_full_path())
+    self.__index_sections(text)
     if not self.__config.sections() or self.__MAIN_SECTION not in self.__config.sections():
       raise EmptyConfigError(
                              "Configuration file: '%s' missing necessary '%s' section!"
                              % (self.get_full_path(),self.__MAIN_SECTION)
                              )
-    for section in self.__config.sections():
-      if section.startswith(self.__GROUP_PREFIX):
-        group_name = section[len(self.__GROUP_PREFIX):]
-        self.groups[group_name] = Group(group_name)
-        members = self.__group_members_as_list(group_name)
-        self.groups[group_name]._add_members(members)
-        permissions = self.__group_permissions(group_name)
-        self.groups[group_name]._set_permissions(permissions)
-      elif section.startswith(self.__REPO_PREFIX):
-        repo_name = section[len(self.__REPO_PREFIX):]
-        self.repos[repo_name] = Repo(repo_name)
-
-  # Public instance methods
+    self.begin()
+    try:
+      self.__load_sections()
+    except:
+      self.rollback()
+      raise
+    self.commit()
+
+  def begin(self,):
+    """
+    Opens a transaction, changes to the configuration are only kept
+    in memory until the matching commit. Transactions may be nested,
+    only the outermost commit writes the file. Each transaction keeps
+    an undo log of the groups, repositories and sections it changes.
+    """
+    self.__snapshots.append(({},{},{},set(self.__dirty),))
+
+  def commit(self,):
+    """
+    Closes the innermost transaction, the outermost commit writes the
+    configuration file once if anything changed.
+    """
+    if len(self.__snapshots) == 1 and self.__dirty:
+      try:
+        self.__write_file()
+      except:
+        self.rollback()
+        raise
+    undo = self.__snapshots.pop()
+    if self.__snapshots:
+      # the enclosing transaction keeps what it saved first
+      for (saved,outer) in zip(undo[:3],self.__snapshots[-1][:3]):
+        for (name,value) in saved.items():
+          outer.setdefault(name,value)
+
+  def rollback(self,):
+    """
+    Closes the innermost transaction, discarding every change made
+    since the matching begin.
+    """
+    (groups,repos,sections,self.__dirty) = self.__snapshots.pop()
+    for (saved,current) in ((groups,self.groups),(repos,self.repos)):
+      for (name,value) in saved.items():
+        if value is not None:
+          current[name] = value
+        elif name in current:
+          del current[name]
+    for (section,items) in sections.items():
+      if items is not None:
+        self.__config._sections[section] = self.__config._dict(items)
+      elif self.__config.has_section(section):
+        self.__config.remove_section(section)
+    self.__membership = None
+    self.__access = None
+    self.__references = None
+    self.__paths = None
+
+  def transaction(self,):
+    """
+    Context manager around begin/commit, rolling back if the block raises.
+    """
+    self.begin()
+    try:
+      yield self
+    except:
+      self.rollback()
+      raise
+    self.commit()
+  transaction = contextlib.contextmanager(transaction)
 
   def get_full_path(self,):
     """
@@ -118,40 +340,155 @@ class SvndaeConfig:
     """
     return self.__grab_value(self.__MAIN_SECTION,key)
 
-  def expand_group_membership(self,group,previous_groups=None):
+  def get_key_index(self,):
+    """
+    Returns the path of the key index used by svndae-keys-lookup, or
+    None if svndae should only manage authorized_keys.
+    """
+    if self.__config.has_option(self.__MAIN_SECTION,self._KEYINDEX):
+      return self.get_conf_param(self._KEYINDEX) or None
+    return None
+
+  def get_authz(self,):
+    """
+    Returns the path of the authz file exported for svnserve and
+    mod_authz_svn, or None if none should be written.
+    """
+    if self.__config.has_option(self.__MAIN_SECTION,self._AUTHZ):
+      return self.get_conf_param(self._AUTHZ) or None
+    return None
+
+  def get_svnroot(self,):
+    """
+    Returns the directory svnserve serves the repositories from, or
+    None if svndae should not configure svnserve.
+    """
+    if self.__config.has_option(self.__MAIN_SECTION,self._SVNROOT):
+      return self.get_conf_param(self._SVNROOT) or None
+    return None
+
+  def expand_group_membership(self,group,report=None,):
     """
     Gets the full listing of members who are assigned to groups,
-    as groups can contain other groups for members. Handles circular
-    references by doing a "union" operation.
-    """
-    if group in self.groups.keys():
-      members = self.groups[group].get_direct_members()
-      for new_group in self.groups[group].get_groups():
-        if previous_groups and new_group in previous_groups:
-          continue
-        elif previous_groups:
-          previous_groups.append(group)
-        else:
-          previous_groups = [group]
-        members.extend(self.expand_group_membership(new_group,previous_groups))
-      return self.__uniq(members)
+    as groups can contain other groups for members. Circular
+    references share the same members. References to non-existant
+    groups are skipped and added to the report, if one is given.
+    Never writes the configuration file.
+    """
+    if group in self.groups:
+      stats.incr('membership.expand_calls')
+      membership = self.__get_membership()
+      if report is not None:
+        report._add_dangling(membership.dangling(group))
+      return list(membership.members(group))
     else:
-      if previous_groups:
-        # clean up the Group because someone added a non-existant group
-        self.remove_member_or_subgroup_from_group("@%s" % group,previous_groups[-1])
-        return []
-      else:
-        # the group asked to expand is invalid
-        raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
+      # the group asked to expand is invalid
+      raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
+
+  def expand_user_membership(self,user,):
+    """
+    Gets every group a user belongs to, either directly or through
+    subgroups.
+    """
+    return list(self.__get_membership().groups(user))
+
+  def get_member_groups(self,member,):
+    """
+    Returns the groups a member, or an @subgroup, is directly
+    listed in.
+    """
+    references = self.__get_references()
+    if member.startswith("@"):
+      return sorted(references.parent_groups(member[1:]))
+    return sorted(references.member_groups(member))
+
+  def get_repo_groups(self,repo,type=None,):
+    """
+    Returns the groups granted permissions on a repository, optionally
+    only those with the given permission type.
+    """
+    if type is not None and type not in MODES:
+      raise BadPermissionError("The specified permission type '%s' is invalid!" % type)
+    return sorted(self.__get_references().repo_groups(repo,type))
+
+  def resolve_repo(self,path,):
+    """
+    Returns (repository name, path inside of the repository) for the
+    repository owning a requested path or URL, or None.
+    """
+    if self.__paths is None:
+      self.__paths = RepoTrie(self.repos.values())
+    return self.__paths.resolve(path)
+
+  def has_access(self,user,repo,type,):
+    """
+    Returns whether a user may read or write a repository, through any
+    of their groups.
+    """
+    if type != self._WRITE and type != self._READ:
+      raise BadPermissionError("The specified permission type '%s' is invalid!" % type)
+    return self.get_access_matrix().can(user,repo,type)
+
+  def get_user_repos(self,user,type=None,):
+    """
+    Returns the repositories a user may access, optionally only those
+    with the given permission type.
+    """
+    if type is not None and type not in MODES:
+      raise BadPermissionError("The specified permission type '%s' is invalid!" % type)
+    return self.get_access_matrix().get_repos(user,type)
+
+  def get_access_matrix(self,):
+    """
+    Returns the compiled AccessMatrix, building it on first use and
+    bringing it up to date with membership changes.
+    """
+    membership = self.__get_membership()
+    if self.__access is None:
+      self.__access = AccessMatrix.compile(self)
+      membership.track_changes()
+    else:
+      changed = membership.changes()
+      if changed:
+        self.__access.update_users(self,changed)
+    return self.__access
+
+  def check_membership(self,report=None,):
+    """
+    Returns a MembershipReport listing every reference to a
+    non-existant group.
+    """
+    if report is None:
+      report = MembershipReport()
+    report._add_dangling(self.__get_membership().dangling())
+    return report
+
+  def repair_membership(self,report=None,):
+    """
+    Removes the references to non-existant groups listed in the report,
+    or all of them when no report is given, in a single write.
+    """
+    if report is None:
+      report = self.check_membership()
+    removals = {}
+    for (group,subgroup) in report.dangling:
+      if group in self.groups and subgroup not in self.groups:
+        removals.setdefault(group,[]).append("@%s" % subgroup)
+    with self.transaction():
+      for (group,subgroups) in removals.items():
+        self.remove_members_or_subgroups_from_group(subgroups,group)
+    return report
 
   def add_member_or_subgroup_to_group(self,user,group,):
     """
     Adds a member to a group as defined in the configuration file,
     also adds the member to the Group object representing the group.
     """
-    if group in self.groups.keys():
+    if group in self.groups:
+      self.__save_group(group)
       members = self.groups[group]._add_member(user)
       self.__update_group_membership(group,members)
+      self.__invalidate_membership(group)
     else:
       raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
 
@@ -159,9 +496,11 @@ class SvndaeConfig:
     """
     Adds multiple members to a Group.
     """
-    if group in self.groups.keys():
+    if group in self.groups:
+      self.__save_group(group)
       members = self.groups[group]._add_members(users)
       self.__update_group_membership(group,members)
+      self.__invalidate_membership(group)
     else:
       raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
 
@@ -170,9 +509,11 @@ class SvndaeConfig:
     Removes a member from a group as defined in the configuration file,
     also removes the member from the Group object representing the group.
     """
-    if group in self.groups.keys():
+    if group in self.groups:
+      self.__save_group(group)
       members = self.groups[group]._remove_member(user)
       self.__update_group_membership(group,members)
+      self.__invalidate_membership(group)
     else:
       raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
 
@@ -180,9 +521,11 @@ class SvndaeConfig:
     """
     Removes multiple members from a Group.
     """
-    if group in self.groups.keys():
+    if group in self.groups:
+      self.__save_group(group)
       members = self.groups[group]._remove_members(users)
       self.__update_group_membership(group,members)
+      self.__invalidate_membership(group)
     else:
       raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
 
@@ -190,9 +533,11 @@ class SvndaeConfig:
     """
     Removes permission for a repo from a group
     """
-    if group in self.groups.keys():
+    if group in self.groups:
+      self.__save_group(group)
       perms = self.groups[group]._remove_repo_permission(type,repo)
-      self.__update_group_permissions(group,perms)
+      self.__update_group_permissions(group,{type: perms})
+      self.__invalidate_access(group)
     else:
       raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
 
@@ -200,13 +545,15 @@ class SvndaeConfig:
     """
     Adds permission for a repo to a group
     """
-    if group in self.groups.keys():
-      if type is not self._WRITE and type is not self._READ:
+    if group in self.groups:
+      if type != self._WRITE and type != self._READ:
         raise BadPermissionError("The specified permission type '%s' is invalid!" % type)
-      if repo not in self.repos.keys() and repo != self._ALL_REPOS:
+      if repo not in self.repos and repo != self._ALL_REPOS:
         raise NonExistantRepositoryError("The repository '%s' does not have an entry!" % repo)
+      self.__save_group(group)
       perms = self.groups[group]._add_repo_permission(type,repo)
-      self.__update_group_permissions(group,perms)
+      self.__update_group_permissions(group,{type: perms[type]})
+      self.__invalidate_access(group)
     else:
       raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
 
@@ -214,17 +561,26 @@ class SvndaeConfig:
     """
     Adds a new group to the configuration file
     """
+    self.__save_group(group)
     self.groups[group] = Group(group)
     self.__add_section("%s%s" % (self.__GROUP_PREFIX,group))
     self.__add_section_value("%s%s" % (self.__GROUP_PREFIX,group),self.__MEMBER_AREA,'',)
+    self.__invalidate_membership(group)
 
   def remove_group(self,group):
     """
-    Removes a group
-    """
-    if group in self.groups.keys():
-      del self.groups[group]
-      self.__remove_section("%s%s" % (self.__GROUP_PREFIX,group))
+    Removes a group along with the references to it from
+    other groups
+    """
+    if group in self.groups:
+      with self.transaction():
+        for parent in self.get_member_groups("@%s" % group):
+          if parent != group:
+            self.remove_member_or_subgroup_from_group("@%s" % group,parent)
+        self.__save_group(group)
+        del self.groups[group]
+        self.__remove_section("%s%s" % (self.__GROUP_PREFIX,group))
+        self.__invalidate_membership(group)
     else:
       raise NonExistantGroupError("The group '%s' does not yet exist!" % group)
 
@@ -232,7 +588,14 @@ class SvndaeConfig:
     """
     Adds a new repository to the configuration file
     """
+    if repo in self.repos and self.__paths is not None:
+      self.__paths.remove(self.repos[repo])
+    self.__save_repo(repo)
     self.repos[repo] = Repo(repo,path)
+    if self.__access is not None:
+      self.__access.add_repo(repo)
+    if self.__paths is not None:
+      self.__paths.add(self.repos[repo])
     self.__add_section("%s%s" % (self.__REPO_PREFIX,repo))
     if path:
       self.__update_repo_path(repo,path)
@@ -241,46 +604,338 @@ class SvndaeConfig:
     """
     Removes a repository
     """
-    if repo in self.repos.keys():
-      del self.repos[repo]
-      self.__remove_section("%s%s" % (self.__REPO_PREFIX,repo))
+    if repo in self.repos:
+      with self.transaction():
+        for (type,groups) in self.__get_references().repo_permissions(repo).items():
+          for group in sorted(groups):
+            # the repository may be listed more than once
+            while repo in self.groups[group].get_permissions().get(type,()):
+              self.unset_permission(group,type,repo)
+        if self.__paths is not None:
+          self.__paths.remove(self.repos[repo])
+        self.__save_repo(repo)
+        del self.repos[repo]
+        if self.__access is not None:
+          self.__access.remove_repo(repo)
+        self.__remove_section("%s%s" % (self.__REPO_PREFIX,repo))
     else:
       raise NonExistantRepositoryError("The repository '%s' does not have an entry!" % repo)
 
-  def clean_config(self,):
+  def clean_config(self,dry_run=False,):
     """
-    Clean the configuration file from invalid entries
+    Clean the configuration file from invalid entries, returns a
+    CleanReport of the repairs. Everything is checked first and then
+    repaired in a single write, or left alone on a dry run.
     """
-    for group_name,group in self.groups.items():
+    report = CleanReport()
+    for group_name in self.groups.keys():
+      group = self.groups[group_name]
+      section = "%s%s" % (self.__GROUP_PREFIX,group_name)
       for subgroup in group.get_groups():
-        if subgroup not in self.groups.keys():
-          self.remove_member_or_subgroup_from_group("@%s" % subgroup,group_name)
+        if subgroup not in self.groups:
+          report.subgroups.append((group_name,subgroup))
       for key in self.__DEFAULT_FIELDS[self.__GROUP_PREFIX]:
-        section = "%s%s" % (self.__GROUP_PREFIX,group_name)
-        try:
-          values = self.__grab_value(section,key).split()
-          if key is self._WRITE or key is self._READ:
-            for value in values:
-              if value not in self.repos.keys():
-                self.unset_permission(group_name,key,value)
-        except ConfigParser.NoOptionError:
-          self.__add_section_value(section,key,'')
+        if not self.__config.has_option(section,key):
+          report.fields.append((group_name,key))
+      perms = group.get_permissions()
+      for type in (self._WRITE,self._READ):
+        for repo in perms.get(type,()):
+          if repo not in self.repos and repo != self._ALL_REPOS:
+            report.permissions.append((group_name,type,repo))
+    if report and not dry_run:
+      with self.transaction():
+        for (group_name,key) in report.fields:
+          self.__add_section_value("%s%s" % (self.__GROUP_PREFIX,group_name),key,'')
+        removals = {}
+        for (group_name,subgroup) in report.subgroups:
+          removals.setdefault(group_name,[]).append("@%s" % subgroup)
+        for (group_name,subgroups) in removals.items():
+          self.remove_members_or_subgroups_from_group(subgroups,group_name)
+        for (group_name,type,repo) in report.permissions:
+          self.unset_permission(group_name,type,repo)
+    return report
 
   # Private instance methods
-  
+
+  def __load_sections(self,):
+    """
+    Sets up the Group and Repo objects for the sections of the
+    configuration file.
+    """
+    groups = []
+    repos = []
+    for section in self.__config.sections():
+      if section.startswith(self.__GROUP_PREFIX):
+        groups.append(section[len(self.__GROUP_PREFIX):])
+      elif section.startswith(self.__REPO_PREFIX):
+        repos.append(section[len(self.__REPO_PREFIX):])
+    if self.__lazy:
+      self.groups = _LazySections(groups,self.__load_group)
+      self.repos = _LazySections(repos,self.__load_repo)
+    else:
+      for group_name in groups:
+        self.groups[group_name] = self.__load_group(group_name)
+      for repo_name in repos:
+        self.repos[repo_name] = self.__load_repo(repo_name)
+
+  def __load_group(self,group_name,):
+    """
+    Sets up a Group from its section
+    """
+    stats.incr('config.groups_loaded')
+    group = Group(group_name)
+    group._add_members(self.__group_members_as_list(group_name))
+    group._set_permissions(self.__group_permissions(group_name))
+    return group
+
+  def __load_repo(self,repo_name,):
+    """
+    Sets up a Repo from its section
+    """
+    section = "%s%s" % (self.__REPO_PREFIX,repo_name)
+    path = None
+    if self.__config.has_option(section,self.__REPO_PATH_FIELD):
+      path = self.__grab_value(section,self.__REPO_PATH_FIELD)
+    return Repo(repo_name,path)
+
+  def __get_membership(self,):
+    """
+    Returns the membership index, building it on first use.
+    """
+    if self.__membership is None:
+      self.__membership = MembershipIndex(self.groups)
+    return self.__membership
+
+  def __get_references(self,):
+    """
+    Returns the reference index, building it on first use.
+    """
+    if self.__references is None:
+      self.__references = ReferenceIndex(self.groups)
+    return self.__references
+
+  def __invalidate_membership(self,group,):
+    """
+    Tells the membership and reference indexes, if they were built,
+    that the members of a group changed.
+    """
+    if self.__membership is not None:
+      self.__membership.invalidate(group)
+    if self.__references is not None:
+      self.__references.update(group)
+
+  def __invalidate_access(self,group,):
+    """
+    Recompiles the access rows of the members of a group whose
+    permissions changed, if the access matrix was built.
+    """
+    if self.__references is not None:
+      self.__references.update(group)
+    if self.__access is not None:
+      self.__access.update_users(self,self.__get_membership().members(group))
+
+  def __read_file(self,):
+    """
+    Returns the text of the configuration file along with its stamp.
+    Writers replace the file with a rename, so reading needs no lock.
+    """
+    f = open(self.get_full_path(),'rb')
+    try:
+      return (f.read(),get_stat_stamp(os.fstat(f.fileno())))
+    finally:
+      f.close()
+
+  def __index_sections(self,text,):
+    """
+    Records the text of the configuration file and where each of its
+    sections starts and ends, so unchanged sections can be copied as
+    they are when writing.
+    """
+    matches = list(_SECTION_RE.finditer(text))
+    self.__text = text
+    self.__spans = []
+    if matches:
+      self.__preamble = matches[0].start()
+    else:
+      self.__preamble = len(text)
+    for (i,match) in enumerate(matches):
+      if i + 1 < len(matches):
+        end = matches[i + 1].start()
+      else:
+        end = len(text)
+      self.__spans.append((match.group('header'),match.start(),end))
+
+  def __render_option(self,key,value,):
+    """
+    Renders an option the way RawConfigParser.write does
+    """
+    if value is None:
+      return '%s\n' % key
+    return '%s = %s\n' % (key,str(value).replace('\n','\n\t'))
+
+  def __render_section(self,section,start=None,end=None,):
+    """
+    Renders a section from its own options, without the defaults.
+    With the span of its original text, comments and blank lines stay
+    where they were, options keep their place and new options go
+    before the comments and blank lines that ended it.
+    """
+    options = self.__config._sections[section]
+    lines = ['[%s]\n' % section]
+    body = []
+    if start is not None:
+      body = self.__text[start:end].splitlines(True)[1:]
+    trailer = []
+    while body and (not body[-1].strip() or body[-1][0] in '#;'):
+      trailer.insert(0,body.pop())
+    done = set(['__name__'])
+    skipping = False
+    for line in body:
+      if not line.strip() or line[0] in '#;':
+        lines.append(line)
+        skipping = False
+        continue
+      if line[0].isspace() and skipping:
+        # continuation of an option, rendered with its value
+        continue
+      match = _OPTION_RE.match(line)
+      skipping = True
+      if match is None:
+        continue
+      key = self.__config.optionxform(match.group('option').rstrip())
+      if key in options and key not in done:
+        lines.append(self.__render_option(key,options[key]))
+        done.add(key)
+    for (key,value) in options.items():
+      if key not in done:
+        lines.append(self.__render_option(key,value))
+    lines.append(''.join(trailer) or '\n')
+    return ''.join(lines)
+
+  def __render(self,):
+    """
+    Returns the new text of the configuration file, copying unchanged
+    sections from the original text and rendering only the changed
+    ones. New sections go at the end.
+    """
+    out = [self.__text[:self.__preamble]]
+    seen = set()
+    for (section,start,end) in self.__spans:
+      if section == ConfigParser.DEFAULTSECT:
+        out.append(self.__text[start:end])
+        continue
+      if not self.__config.has_section(section):
+        continue
+      if section not in self.__dirty:
+        out.append(self.__text[start:end])
+      elif section not in seen:
+        out.append(self.__render_section(section,start,end))
+      seen.add(section)
+    text = ''.join(out)
+    added = [self.__render_section(section) for section in self.__config.sections() if section not in seen]
+    if added and text and not text.endswith('\n\n'):
+      if not text.endswith('\n'):
+        text += '\n'
+      text += '\n'
+    return text + ''.join(added)
+
+  def __write(self,):
+    """
+    Writes the configuration file, deferred until commit while a
+    transaction is open.
+    """
+    if not self.__snapshots:
+      try:
+        self.__write_file()
+      except ConfigConflictError:
+        # back to the version we last read or wrote, like a rollback
+        self.__load(self.__text)
+        raise
+
+  def __write_file(self,):
+    """
+    Writes the configuration file through a temporary file and a rename
+    so readers never see a partial file. Writers hold an exclusive lock
+    on a lock file next to it and refuse to overwrite a version they
+    did not read.
+    """
+    with stats.timer('config.render'):
+      text = self.__render()
+    path = self.get_full_path()
+    lock = os.open('%s.lock' % path,os.O_RDWR | os.O_CREAT,0666)
+    try:
+      fcntl.flock(lock,fcntl.LOCK_EX)
+      try:
+        current = get_stat_stamp(os.stat(path))
+      except OSError, e:
+        if e.errno != errno.ENOENT:
+          raise
+        current = None
+      if current != self.__stamp:
+        raise ConfigConflictError("Configuration file: '%s' was changed by someone else, reload it and try again!" % path)
+      with util.write_file(path) as out:
+        out.write(text)
+        out.flush()
+        stamp = get_stat_stamp(os.fstat(out.fileno()))
+    finally:
+      os.close(lock)
+    stats.incr('config.writes')
+    stats.incr('config.sections_written',len(self.__dirty))
+    stats.incr('config.bytes_written',len(text))
+    self.__stamp = stamp
+    self.__index_sections(text)
+    self.__dirty = set()
+
+  def __save_group(self,group,):
+    """
+    Records a Group in the undo log of the open transaction before it
+    changes, unless it was already recorded.
+    """
+    if self.__snapshots and group not in self.__snapshots[-1][0]:
+      saved = None
+      if group in self.groups:
+        saved = self.groups[group]._copy()
+      self.__snapshots[-1][0][group] = saved
+      stats.incr('config.undo_records')
+
+  def __save_repo(self,repo,):
+    """
+    Records a Repo in the undo log of the open transaction before it
+    is replaced or removed, unless it was already recorded.
+    """
+    if self.__snapshots and repo not in self.__snapshots[-1][1]:
+      self.__snapshots[-1][1][repo] = self.repos.get(repo)
+      stats.incr('config.undo_records')
+
+  def __save_section(self,section,):
+    """
+    Records a section in the undo log of the open transaction before
+    it changes, unless it was already recorded.
+    """
+    if self.__snapshots and section not in self.__snapshots[-1][2]:
+      saved = None
+      if self.__config.has_section(section):
+        saved = self.__config._sections[section].items()
+      self.__snapshots[-1][2][section] = saved
+      stats.incr('config.undo_records')
+
   def __add_section(self,section,):
     """
     Adds a new section the the configuration file
     """
+    self.__save_section(section)
     self.__config.add_section(section,)
-    self.__config.write(open(self.get_full_path(),'wb'))
+    self.__dirty.add(section)
+    self.__write()
 
   def __remove_section(self,section,):
     """
     Removes a section from the configuration file
     """
+    self.__save_section(section)
     self.__config.remove_section(section,)
-    self.__config.write(open(self.get_full_path(),'wb'))
+    self.__dirty.add(section)
+    self.__write()
 
   def __grab_value(self,section,key,):
     """
@@ -292,8 +947,10 @@ class SvndaeConfig:
     """
     Wrapper to add a section value to the configuration file
     """
+    self.__save_section(section)
     self.__config.set(section,key,value)
-    self.__config.write(open(self.get_full_path(),'wb'))
+    self.__dirty.add(section)
+    self.__write()
 
   def __group_members_as_string(self,group,):
     """
@@ -314,16 +971,13 @@ class SvndaeConfig:
     """
     section = "%s%s" % (self.__GROUP_PREFIX,group)
     perms = {}
-    try:
-      perms[self._WRITE] = self.__grab_value(section,self._WRITE).split()
-    except ConfigParser.NoOptionError:
-      self.__add_section_value(section,self._WRITE,'')
-      perms[self._WRITE] = []
-    try:
-      perms[self._READ] = self.__grab_value(section,self._READ).split()
-    except ConfigParser.NoOptionError:
-      self.__add_section_value(section,self._READ,'')
-      perms[self._READ] = []
+    for type in (self._WRITE,self._READ):
+      try:
+        perms[type] = self.__grab_value(section,type).split()
+      except ConfigParser.NoOptionError:
+        if not self.__lazy:
+          self.__add_section_value(section,type,'')
+        perms[type] = []
     return perms
 
   def __update_group_membership(self,group,members,):
@@ -344,14 +998,3 @@ class SvndaeConfig:
     Updates the path of a repository in the configuration file.
     """
     self.__add_section_value("%s%s" % (self.__REPO_PREFIX,repo), self.__REPO_PATH_FIELD,path)
-
-  def __uniq(self,list,):
-    """
-    Removes duplicates from a list.
-    """
-    if not list:
-      return []
-    keys = {}
-    for l in list:
-      keys[l] = 1
-    return keys.keys()
@@ -0,0 +1,161 @@
+"""
+module author: Andrew Stucki
+
+Keeps the compiled access tables resident and answers svndae-filter over
+a Unix domain socket next to the configuration file. Each request is a
+line 'repos USER [read|write]', answered by 'ok REPO...' or
+'error MESSAGE'. The configuration file is loaded again as soon as it
+changes.
+"""
+
+import os
+import errno
+import socket
+import logging
+import optparse
+import threading
+import SocketServer
+
+from svndae import snapshot
+from svndae.acl import MODES
+from svndae.config import SvndaeConfig
+from svndae.filter import get_socket_path
+
+log = logging.getLogger('svndae.app')
+
+DEFAULT_DIR = os.path.join('~','.svndae','svndae.conf')
+
+class _Handler(SocketServer.StreamRequestHandler):
+
+  def handle(self):
+    for line in self.rfile:
+      self.wfile.write('%s\n' % self.server.answer(line.split()))
+
+class AccessServer(SocketServer.ThreadingMixIn,SocketServer.UnixStreamServer):
+  """
+  Answers access queries from the AccessMatrix of a configuration file
+  """
+
+  daemon_threads = True
+
+  def __init__(self,socket_path,conf,):
+    """
+    Initialization method, takes over socket_path if whatever created
+    it is gone.
+    """
+    self.conf = conf
+    self.__lock = threading.Lock()
+    self.__state = None
+    self.reload()
+    _remove_stale_socket(socket_path)
+    umask = os.umask(0077)
+    try:
+      SocketServer.UnixStreamServer.__init__(self,socket_path,_Handler)
+    finally:
+      os.umask(umask)
+
+  # Public instance methods
+
+  def reload(self,):
+    """
+    Compiles the configuration file, keeping the tables loaded before
+    when it can not be read.
+    """
+    (conf_path,conf_name) = os.path.split(self.conf)
+    try:
+      cfg = SvndaeConfig(conf_path,name=conf_name,lazy=True)
+      self.__state = (cfg.get_stamp(),cfg.get_access_matrix())
+    except Exception:
+      if self.__state is None:
+        raise
+      log.exception('Unable to reload %s, keeping the previous tables', self.conf)
+      # do not try again until the file changes
+      self.__state = (snapshot.get_stamp(self.conf),self.__state[1])
+    else:
+      log.info('Loaded %s', self.conf)
+
+  def get_matrix(self,):
+    """
+    Returns the AccessMatrix, reloading the configuration file first
+    if it changed.
+    """
+    state = self.__state
+    try:
+      stamp = snapshot.get_stamp(self.conf)
+    except OSError:
+      return state[1]
+    if stamp != state[0]:
+      self.__lock.acquire()
+      try:
+        if self.__state is state:
+          self.reload()
+      finally:
+        self.__lock.release()
+    return self.__state[1]
+
+  def answer(self,request,):
+    """
+    Returns the answer line for the words of a request line
+    """
+    if len(request) in (2,3) and request[0] == 'repos':
+      mode = None
+      if len(request) == 3:
+        mode = request[2]
+        if mode not in MODES:
+          return 'error unknown mode %s' % mode
+      return ' '.join(['ok'] + self.get_matrix().get_repos(request[1],mode))
+    return 'error bad request'
+
+def _remove_stale_socket(socket_path,):
+  """
+  Removes a socket left behind by a daemon that is not running anymore
+  """
+  if not os.path.exists(socket_path):
+    return
+  sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+  try:
+    try:
+      sock.connect(socket_path)
+    except socket.error, e:
+      if e.args[0] not in (errno.ECONNREFUSED,errno.ENOENT):
+        raise
+      os.unlink(socket_path)
+    else:
+      raise socket.error(errno.EADDRINUSE,"Another daemon listens on '%s'" % socket_path)
+  finally:
+    sock.close()
+
+class App(object):
+  name = None
+
+  def run(class_):
+    app = class_()
+    return app.main()
+  run = classmethod(run)
+
+  def main(self):
+    self.setup_basic_logging()
+    log.setLevel(logging.INFO)
+    parser = self.create_parser()
+    (options, args) = parser.parse_args()
+    if args:
+      parser.error('no arguments expected')
+    socket_path = get_socket_path(options.conf)
+    server = AccessServer(socket_path,options.conf)
+    log.info('Listening on %s', socket_path)
+    try:
+      server.serve_forever()
+    finally:
+      server.server_close()
+      os.unlink(socket_path)
+
+  def setup_basic_logging(self):
+    logging.basicConfig()
+
+  def create_parser(self):
+    parser = optparse.OptionParser()
+    parser.set_defaults(
+      conf=os.path.expanduser(DEFAULT_DIR),
+    )
+    parser.add_option('--conf',metavar='PATH',help='path to svndae configuration file',)
+    return parser
@@ -0,0 +1,223 @@
+"""
+module author: Andrew Stucki
+
+Runs for every svn+ssh connection, so it asks svndae-daemon when one
+is running and otherwise only looks up the cached access of the
+connecting user, unless the cache is out of date.
+"""
+
+import os
+import sys
+import socket
+
+# everything else is imported when needed, see test_imports
+from svndae import stats
+
+DEFAULT_CONF = os.path.join('~','.svndae','svndae.conf')
+SVNSERVE = 'svnserve'
+ALLOWED_COMMAND = [SVNSERVE,'-t']
+DAEMON_TIMEOUT = 5.0
+
+class FilterError(Exception):
+  """
+  Base class for filter errors
+  """
+
+class MissingCommandError(FilterError):
+  """
+  No command was passed along by sshd
+  """
+
+class CommandNotAllowedError(FilterError):
+  """
+  The requested command is not svnserve in tunnel mode
+  """
+
+class AccessDeniedError(FilterError):
+  """
+  The user may not access any repository
+  """
+
+class SvnserveNotConfiguredError(FilterError):
+  """
+  svndae-sync did not write an svnserve configuration with an authz
+  file and a repository root
+  """
+
+class DaemonUnavailableError(FilterError):
+  """
+  svndae-daemon could not answer
+  """
+
+def check_command(command,):
+  """
+  Makes sure the command requested over ssh is one we allow.
+  """
+  if command is None:
+    raise MissingCommandError("Need SSH_ORIGINAL_COMMAND in environment.")
+  if command.split() != ALLOWED_COMMAND:
+    raise CommandNotAllowedError("The command '%s' is not allowed!" % command)
+
+def load_user_access(path,user,):
+  """
+  Returns an AccessMatrix holding at least the access of user to the
+  repositories of the configuration file at path, from the access cache
+  when up to date, otherwise compiling the configuration and refreshing
+  the cache.
+  """
+  from svndae import accesscache
+  with stats.timer('filter.read_access_cache'):
+    matrix = accesscache.read_user_access(path,user)
+  if matrix is not None:
+    return matrix
+  stats.incr('filter.access_cache_misses')
+  from svndae.config import SvndaeConfig
+  (conf_path,conf_name) = os.path.split(path)
+  cfg = SvndaeConfig(conf_path,name=conf_name,lazy=True)
+  try:
+    accesscache.update_access_cache(cfg)
+  except (IOError,OSError,accesscache.sqlite3.Error):
+    pass
+  return cfg.get_access_matrix()
+
+def get_socket_path(path,):
+  """
+  Returns where svndae-daemon listens for the configuration file at path
+  """
+  return '%s.sock' % path
+
+def get_svnserve_conf_path(path,):
+  """
+  Returns where svndae-sync writes the svnserve configuration for the
+  configuration file at path
+  """
+  return '%s.svnserve' % path
+
+def read_svnserve_conf(path,):
+  """
+  Returns {(section, option): value} for an svnserve configuration
+  written by svndae-sync, or {} when there is none. Parsed by hand,
+  ConfigParser costs more to import than the rest of the filter.
+  """
+  try:
+    f = open(path)
+  except IOError:
+    return {}
+  settings = {}
+  section = None
+  try:
+    for line in f:
+      line = line.strip()
+      if not line or line[0] in '#;':
+        continue
+      if line.startswith('[') and line.endswith(']'):
+        section = line[1:-1]
+      elif '=' in line:
+        (option,value) = line.split('=',1)
+        settings[(section,option.strip())] = value.strip()
+  finally:
+    f.close()
+  return settings
+
+def get_svnserve_command(path,user,):
+  """
+  Returns the svnserve command line for user, confined to the
+  repository root and enforcing the authz file of the svnserve
+  configuration svndae-sync wrote for the configuration file at path.
+  """
+  conf = get_svnserve_conf_path(path)
+  settings = read_svnserve_conf(conf)
+  root = settings.get(('svndae','root'))
+  if not root or not settings.get(('general','authz-db')):
+    raise SvnserveNotConfiguredError("No svnserve configuration with an authz file and a repository root in '%s', set authz and svnroot and run svndae-sync!" % conf)
+  return ALLOWED_COMMAND + ['-r',root,'--config-file',conf,'--tunnel-user=%s' % user]
+
+def query_daemon(socket_path,user,mode=None,timeout=DAEMON_TIMEOUT,):
+  """
+  Asks svndae-daemon for the repositories user may access in the given
+  mode, or in any mode. Raises DaemonUnavailableError when it does not
+  answer properly.
+  """
+  request = ['repos',user]
+  if mode is not None:
+    request.append(mode)
+  sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+  try:
+    try:
+      sock.settimeout(timeout)
+      sock.connect(socket_path)
+      sock.sendall('%s\n' % ' '.join(request))
+      sock.shutdown(socket.SHUT_WR)
+      chunks = []
+      while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+          break
+        chunks.append(chunk)
+    except socket.error, e:
+      raise DaemonUnavailableError("Unable to query '%s': %s" % (socket_path,e))
+  finally:
+    sock.close()
+  answer = ''.join(chunks)
+  if not answer.endswith('\n') or answer.count('\n') != 1:
+    raise DaemonUnavailableError("Incomplete answer from '%s'!" % socket_path)
+  words = answer.split()
+  if not words or words[0] != 'ok':
+    raise DaemonUnavailableError("Bad answer from '%s': %s" % (socket_path,answer.strip()))
+  return words[1:]
+
+def get_user_repos(path,user,):
+  """
+  Returns the repositories user may access according to the
+  configuration file at path, from svndae-daemon when it is running.
+  """
+  socket_path = get_socket_path(path)
+  if os.path.exists(socket_path):
+    try:
+      with stats.timer('filter.query_daemon'):
+        return query_daemon(socket_path,user)
+    except DaemonUnavailableError:
+      stats.incr('filter.daemon_failures')
+  return load_user_access(path,user).get_repos(user)
+
+class App(object):
+  name = None
+
+  def run(class_):
+    app = class_()
+    return app.main()
+  run = classmethod(run)
+
+  def main(self):
+    try:
+      (conf,user) = self.parse_args(sys.argv[1:])
+    except ValueError:
+      sys.stderr.write('Usage: svndae-filter [--conf PATH] USER\n')
+      return 1
+    try:
+      check_command(os.environ.get('SSH_ORIGINAL_COMMAND'))
+      command = get_svnserve_command(conf,user)
+      if not get_user_repos(conf,user):
+        raise AccessDeniedError("The user '%s' may not access any repository!" % user)
+    except FilterError, e:
+      sys.stderr.write('ERROR: %s\n' % e)
+      return 1
+    # exec skips the atexit handlers
+    stats.emit()
+    os.execvp(SVNSERVE,command)
+
+  def parse_args(self,args):
+    """
+    Handles the few arguments by hand, optparse costs more to import
+    than the rest of the filter.
+    """
+    conf = os.path.expanduser(DEFAULT_CONF)
+    args = list(args)
+    if args and args[0].startswith('--conf='):
+      conf = args.pop(0)[len('--conf='):]
+    elif len(args) > 1 and args[0] == '--conf':
+      args.pop(0)
+      conf = args.pop(0)
+    if len(args) != 1:
+      raise ValueError(args)
+    return (conf,args[0])
@@ -17,11 +17,83 @@ class IllegalGroupError(GroupError):
   Group name contains illegal characters
   """
 
-class Group:
+def isSafeGroupName(name):
+  """
+  Returns whether name can be written as a [group NAME] section and
+  listed as @NAME: a single word without ']' not starting with '@'.
+  """
+  return name.split() == [name] and ']' not in name and not name.startswith('@')
+
+class _OrderedSet(object):
+  """
+  Set of names remembering the order they were added in. Removed names
+  leave a hole in the order list that is compacted once holes make up
+  half of it, collections.OrderedDict is too slow on Python 2.
+  """
+
+  __slots__ = ('__index','__order','__holes','__list')
+
+  def __init__(self,):
+    self.__index = {}
+    self.__order = []
+    self.__holes = 0
+    self.__list = None
+
+  def __contains__(self,name,):
+    return name in self.__index
+
+  def add(self,name,):
+    """
+    Adds a name, returns whether it was new.
+    """
+    if name in self.__index:
+      return False
+    self.__index[name] = len(self.__order)
+    self.__order.append(name)
+    self.__list = None
+    return True
+
+  def discard(self,name,):
+    """
+    Removes a name, returns whether it was there.
+    """
+    position = self.__index.pop(name,None)
+    if position is None:
+      return False
+    self.__order[position] = None
+    self.__holes += 1
+    self.__list = None
+    if self.__holes * 2 > len(self.__order):
+      self.__order = self.to_list()
+      self.__index = dict([(name,position) for (position,name) in enumerate(self.__order)])
+      self.__holes = 0
+    return True
+
+  def to_list(self,):
+    """
+    Returns the names in order, the list is shared until the next change.
+    """
+    if self.__list is None:
+      if self.__holes:
+        self.__list = [name for name in self.__order if name is not None]
+      else:
+        self.__list = list(self.__order)
+    return self.__list
+
+  def copy(self,):
+    other = _OrderedSet()
+    other.__index = dict(self.__index)
+    other.__order = list(self.__order)
+    other.__holes = self.__holes
+    return other
+
+class Group(object):
   """
   Group class
   """
 
+  __slots__ = ('name','__members','__groups','__permissions')
+
   def __init__(self,name):
     """
     Initialization method
@@ -29,8 +101,9 @@ class Group:
     if ' ' in name:
       raise IllegalGroupError("The group name '%s' contains illegal characters!",name)
     self.name = name
-    self.__members = []
-    self.__groups = []
+    # insertion ordered sets, subgroups are kept by their stripped name
+    self.__members = _OrderedSet()
+    self.__groups = _OrderedSet()
     self.__permissions = {}
 
   # Public instance methods
@@ -46,7 +119,7 @@ class Group:
     Returns the subgroups of this Group mapped to
     readable names.
     """
-    return map(lambda x: x[1:], self.__groups)
+    return self.__groups.to_list()
 
   def get_direct_members(self,):
     """
@@ -54,7 +127,16 @@ class Group:
     are immediately defined in the configuration file,
     not members of this Group's subgroups.
     """
-    return self.__members
+    return self.__members.to_list()
+
+  def has_member(self,member,):
+    """
+    Returns whether a member, or an @subgroup, is directly
+    part of this group.
+    """
+    if member.startswith("@"):
+      return member[1:] in self.__groups
+    return member in self.__members
 
   # Protected instance methods
 
@@ -65,50 +147,30 @@ class Group:
     (members + subgroups)
     """
     for member in members:
-      if ' ' in member:
-        raise IllegalMemberError("The member name '%s' contains illegal characters!" % member)
-      elif member.startswith("@"):
-        self.__groups.append(member)
-      else:
-        self.__members.append(member)
+      self.__add(member)
     return self.__get_members_with_groups()
 
   def _add_member(self,member,):
     """
     Adds single member to the group.
     """
-    if ' ' in member:
-      raise IllegalMemberError("The member name '%s' contains illegal characters!" % member)
-    elif member.startswith("@"):
-      self.__groups.append(member)
-    else:
-      self.__members.append(member)
+    self.__add(member)
     return self.__get_members_with_groups()
 
   def _remove_member(self,member,):
     """
     Removes member from a group.
     """
-    if ' ' in member: 
-      raise IllegalMemberError("The member name '%s' contains illegal characters!" % member)
-    elif member.startswith("@"):
-      self.__groups.remove(member)
-    else:
-      self.__members.remove(member)
-    return self.__members
+    if not self.__discard(member):
+      raise ValueError("'%s' is not a member of the group '%s'!" % (member,self.name))
+    return self.__get_members_with_groups()
 
   def _remove_members(self,members,):
     """
     Removes multiple members from a group.
     """
     for member in members:
-      if ' ' in member: 
-        raise IllegalMemberError("The member name '%s' contains illegal characters!" % member)
-      elif member.startswith("@"):
-        if member in self.__groups:
-          self.__groups.remove(member)
-      elif member in self.__members:
-        self.__members.remove(member)
+      self.__discard(member)
     return self.__get_members_with_groups()
 
   def _add_repo_permission(self,type,repo,):
@@ -132,13 +194,44 @@ class Group:
   def _set_permissions(self,perms,):
     self.__permissions = perms
 
+  def _copy(self,):
+    """
+    Returns an independent copy of this Group
+    """
+    other = Group(self.name)
+    other.__members = self.__members.copy()
+    other.__groups = self.__groups.copy()
+    other.__permissions = dict([(type,list(repos)) for (type,repos) in self.__permissions.items()])
+    return other
+
   # Private instance methods
 
+  def __add(self,member,):
+    """
+    Adds a member or @subgroup, members already in the group keep
+    their position.
+    """
+    if ' ' in member:
+      raise IllegalMemberError("The member name '%s' contains illegal characters!" % member)
+    elif member.startswith("@"):
+      self.__groups.add(member[1:])
+    else:
+      self.__members.add(member)
+
+  def __discard(self,member,):
+    """
+    Removes a member or @subgroup, returns whether it was there.
+    """
+    if ' ' in member:
+      raise IllegalMemberError("The member name '%s' contains illegal characters!" % member)
+    elif member.startswith("@"):
+      return self.__groups.discard(member[1:])
+    return self.__members.discard(member)
+
   def __get_members_with_groups(self,):
     """
     Returns the members + subgroups for this Group
     """
-    retval = []
-    retval.extend(self.__members)
-    retval.extend(self.__groups)
+    retval = list(self.__members.to_list())
+    retval.extend(["@%s" % group for group in self.__groups.to_list()])
     return retval
@@ -2,11 +2,9 @@ import os
 import sys
 import logging
 import optparse
-import ConfigParser
 
 from svndae.config import SvndaeConfig
 from svndae import util
-from svndae.interactive_init import initialize
 
 log = logging.getLogger('svndae.app')
 DEFAULT_DIR = os.path.join('~','.svndae')
@@ -26,18 +24,35 @@ class Init(object):
     parser = self.create_parser()
     (options, args) = parser.parse_args()
     if options.interactive:
+      # the prompting code is only needed here
+      from svndae.interactive_init import initialize
       initialize()
     else:
+      spec = None
+      if options.from_spec:
+        from svndae.spec import SpecError, read_spec, check_spec
+        try:
+          spec = read_spec(options.from_spec)
+          check_spec(spec)
+        except (IOError,SpecError), e:
+          sys.stderr.write("ERROR: Unable to read the spec '%s': %s\n" % (options.from_spec,e))
+          return 1
       print "\nInitializing file system in '%s'" % options.path
       util.mkdir(options.path)
       util.mkdir(os.path.join(options.path,options.dir))
       print "Generating configuration file '%s'" % options.conf
       SvndaeConfig.generate_config(options.path,options.conf,options.dir,options.file)
       config = SvndaeConfig(options.path,name=options.conf)
-      print "Adding default administrative groups"
-      config.create_group(ADMIN_GROUP)
-      config.add_permission(ADMIN_GROUP,SvndaeConfig._WRITE,SvndaeConfig._ALL_REPOS)
-      config.add_permission(ADMIN_GROUP,SvndaeConfig._READ,SvndaeConfig._ALL_REPOS)
+      # everything below is written to the configuration file at once
+      with config.transaction():
+        print "Adding default administrative groups"
+        config.create_group(ADMIN_GROUP)
+        config.add_permission(ADMIN_GROUP,SvndaeConfig._WRITE,SvndaeConfig._ALL_REPOS)
+        config.add_permission(ADMIN_GROUP,SvndaeConfig._READ,SvndaeConfig._ALL_REPOS)
+        if spec is not None:
+          from svndae.spec import apply_spec
+          print "Applying spec '%s'" % options.from_spec
+          apply_spec(config,spec)
       print "Initialization finished!\n"
       print "You can now add users to the file system with the '%s' command!\n" % 'svndae-addkeys'
 
@@ -58,4 +73,5 @@ class Init(object):
     parser.add_option('-d','--dir',metavar='DIR',help='directory that will hold svndae keys',)
     parser.add_option('-c','--conf',metavar='FILE',help='name of the svndae configuration file')
     parser.add_option('-f','--file',metavar='FILE',help='path of the authorized keys file to manage')
+    parser.add_option('--from-spec',metavar='FILE',help='add the repositories and groups of a JSON or INI spec file')
     return parser
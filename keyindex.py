@@ -0,0 +1,71 @@
+"""
+module author: Andrew Stucki
+"""
+
+import os
+import time
+
+from svndae import ssh, util
+
+_SCHEMA = (
+  'CREATE TABLE IF NOT EXISTS keys (fingerprint TEXT NOT NULL, user TEXT NOT NULL, filename TEXT NOT NULL, key TEXT NOT NULL)',
+  'CREATE INDEX IF NOT EXISTS keys_fingerprint ON keys (fingerprint)',
+  'CREATE INDEX IF NOT EXISTS keys_filename ON keys (filename)',
+  'CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, mtime REAL, size INTEGER, sha1 TEXT)',
+  'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)',
+)
+
+def update_key_index(path,keydir,):
+  """
+  Brings the key index at path up to date with the public keys in
+  keydir, only reading the key files that changed since the last
+  update. Readers see either the old or the new index. Returns the
+  number of key files that were added, changed or removed.
+  """
+  db = util.connect_db(path)
+  try:
+    for statement in _SCHEMA:
+      db.execute(statement)
+    previous = {}
+    for row in db.execute('SELECT filename, mtime, size, sha1 FROM files'):
+      previous[row[0]] = tuple(row[1:])
+    row = db.execute("SELECT value FROM meta WHERE name = 'scanned'").fetchone()
+    scanned = time.time()
+    files = ssh.scanKeyFiles(keydir,previous,row and row[0] or 0)
+    changed = [filename for (filename,state) in files.items() if previous.get(filename) != state]
+    removed = [filename for filename in previous.keys() if filename not in files]
+    db.execute('BEGIN')
+    try:
+      for filename in changed + removed:
+        db.execute('DELETE FROM keys WHERE filename = ?',(filename,))
+        db.execute('DELETE FROM files WHERE filename = ?',(filename,))
+      for filename in changed:
+        user = os.path.splitext(filename)[0]
+        keys = ssh.readKeyFile(os.path.join(keydir,filename))
+        for (user,key) in ssh.normalizeKeys([(user,line) for line in keys]):
+          db.execute('INSERT INTO keys VALUES (?, ?, ?, ?)',(ssh.keyFingerprint(key),user,filename,key))
+        db.execute('INSERT INTO files VALUES (?, ?, ?, ?)',(filename,) + files[filename])
+      db.execute("INSERT OR REPLACE INTO meta VALUES ('scanned', ?)",(scanned,))
+    except:
+      db.execute('ROLLBACK')
+      raise
+    db.execute('COMMIT')
+  finally:
+    db.close()
+  return len(changed) + len(removed)
+
+def lookup_key(path,fingerprint,):
+  """
+  Returns the authorized_keys line for the key with the given
+  fingerprint, as written by ssh.generateAuthorizedKeys. A key in the
+  files of several users belongs to the first one by filename, like in
+  authorized_keys.
+  """
+  if not os.path.exists(path):
+    return []
+  db = util.connect_db(path)
+  try:
+    rows = db.execute('SELECT user, key FROM keys WHERE fingerprint = ? ORDER BY filename LIMIT 1',(fingerprint,)).fetchall()
+  finally:
+    db.close()
+  return [ssh.TEMPLATE % dict(user=user,key=key) for (user,key) in rows]
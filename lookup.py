@@ -0,0 +1,74 @@
+"""
+module author: Andrew Stucki
+
+Runs for every login as sshd's AuthorizedKeysCommand, e.g.
+
+  AuthorizedKeysCommand /usr/bin/svndae-keys-lookup --index /path/to/index %t %k
+"""
+
+import os
+import sys
+
+from svndae import ssh
+from svndae.keyindex import lookup_key
+
+DEFAULT_CONF = os.path.join('~','.svndae','svndae.conf')
+USAGE = 'Usage: svndae-keys-lookup [--conf PATH | --index PATH] (--fingerprint FINGERPRINT | TYPE KEY)\n'
+
+def get_index_path(conf,):
+  """
+  Returns the key index configured for a configuration file
+  """
+  from svndae.config import SvndaeConfig
+  (conf_path,conf_name) = os.path.split(conf)
+  return SvndaeConfig(conf_path,name=conf_name,lazy=True).get_key_index()
+
+class App(object):
+  name = None
+
+  def run(class_):
+    app = class_()
+    return app.main()
+  run = classmethod(run)
+
+  def main(self):
+    try:
+      (options,args) = self.parse_args(sys.argv[1:])
+    except ValueError:
+      sys.stderr.write(USAGE)
+      return 1
+    if 'fingerprint' in options:
+      fingerprint = options['fingerprint']
+    else:
+      fingerprint = ssh.keyFingerprint(' '.join(args))
+    index = options.get('index')
+    if index is None:
+      index = get_index_path(options.get('conf',os.path.expanduser(DEFAULT_CONF)))
+    if fingerprint is not None and index is not None:
+      for line in lookup_key(index,fingerprint):
+        sys.stdout.write('%s\n' % line)
+    return 0
+
+  def parse_args(self,args):
+    """
+    Handles the few arguments by hand, optparse costs more to import
+    than the lookup itself.
+    """
+    options = {}
+    args = list(args)
+    while args and args[0].startswith('--'):
+      arg = args.pop(0)
+      if '=' in arg:
+        (name,value) = arg[2:].split('=',1)
+      elif args:
+        (name,value) = (arg[2:],args.pop(0))
+      else:
+        raise ValueError(arg)
+      if name not in ('conf','index','fingerprint'):
+        raise ValueError(arg)
+      options[name] = value
+    if 'conf' in options and 'index' in options:
+      raise ValueError(args)
+    if len(args) != ('fingerprint' not in options and 2 or 0):
+      raise ValueError(args)
+    return (options,args)
@@ -0,0 +1,259 @@
+"""
+module author: Andrew Stucki
+"""
+
+from svndae import stats
+
+class MembershipReport:
+  """
+  Collects the references to non-existant groups found while reading
+  group membership, so they can be repaired separately.
+  """
+
+  def __init__(self,):
+    """
+    Initialization method
+    """
+    self.dangling = []
+
+  def __nonzero__(self,):
+    return bool(self.dangling)
+
+  # Protected instance methods
+
+  def _add_dangling(self,references,):
+    """
+    Adds (group, subgroup) pairs that were not already reported.
+    """
+    for reference in references:
+      if reference not in self.dangling:
+        self.dangling.append(reference)
+
+class MembershipIndex:
+  """
+  Transitive group membership, computed once and kept up to date as
+  groups change. Groups that reference each other form a strongly
+  connected component and share a single member set.
+  """
+
+  def __init__(self,groups,):
+    """
+    Initialization method, groups maps group names to Group objects
+    and is consulted again whenever a group is invalidated.
+    """
+    self.__groups = groups
+    self.__members = {}
+    self.__containing = {}
+    self.__children = {}
+    self.__parents = {}
+    self.__dangling = {}
+    self.__stale = set()
+    self.__changed = None
+    for name in groups.keys():
+      self.__link(name)
+      self.__stale.add(name)
+    self.__refresh()
+
+  # Public instance methods
+
+  def members(self,group,):
+    """
+    Returns every member of a group, including the members of all of
+    its subgroups.
+    """
+    self.__refresh()
+    return self.__members.get(group,frozenset())
+
+  def groups(self,user,):
+    """
+    Returns every group a user is a member of, directly or through
+    subgroups.
+    """
+    self.__refresh()
+    return frozenset(self.__containing.get(user,()))
+
+  def dangling(self,group=None,):
+    """
+    Returns (group, subgroup) pairs for the references to non-existant
+    groups that are reachable from group, or from any group.
+    """
+    if not self.__dangling:
+      return []
+    if group is None:
+      found = []
+      for (name,missing) in self.__dangling.items():
+        found.extend([(name,subgroup) for subgroup in missing])
+      return found
+    found = []
+    seen = set([group])
+    todo = [group]
+    while todo:
+      name = todo.pop()
+      for missing in self.__dangling.get(name,()):
+        found.append((name,missing))
+      for child in self.__children.get(name,()):
+        if child not in seen:
+          seen.add(child)
+          todo.append(child)
+    return found
+
+  def track_changes(self,):
+    """
+    Starts collecting the users whose groups change, see changes.
+    """
+    self.__refresh()
+    self.__changed = set()
+
+  def changes(self,):
+    """
+    Returns the users whose groups changed since the last call.
+    """
+    self.__refresh()
+    changed = self.__changed
+    self.__changed = set()
+    return changed
+
+  def invalidate(self,group,):
+    """
+    Marks a group as changed, the group and every group containing it
+    are recomputed on the next lookup. Also used when a group is created
+    or removed.
+    """
+    self.__stale.update(self.__ancestors(group))
+    self.__link(group)
+    for parent in self.__parents.get(group,()):
+      self.__check_dangling(parent)
+
+  # Private instance methods
+
+  def __link(self,name,):
+    """
+    Records the subgroup references of a group.
+    """
+    for child in self.__children.pop(name,()):
+      parents = self.__parents[child]
+      parents.discard(name)
+      if not parents:
+        del self.__parents[child]
+    group = self.__groups.get(name)
+    if group is not None:
+      children = tuple(group.get_groups())
+      self.__children[name] = children
+      for child in children:
+        self.__parents.setdefault(child,set()).add(name)
+    self.__check_dangling(name)
+
+  def __check_dangling(self,name,):
+    """
+    Records the subgroup references of a group that point nowhere.
+    """
+    missing = tuple([child for child in self.__children.get(name,()) if child not in self.__groups])
+    if missing:
+      self.__dangling[name] = missing
+    else:
+      self.__dangling.pop(name,None)
+
+  def __ancestors(self,name,):
+    """
+    Returns a group along with every group that contains it.
+    """
+    seen = set([name])
+    todo = [name]
+    while todo:
+      for parent in self.__parents.get(todo.pop(),()):
+        if parent not in seen:
+          seen.add(parent)
+          todo.append(parent)
+    return seen
+
+  def __refresh(self,):
+    """
+    Recomputes the stale groups, walking them with Tarjan's algorithm so
+    each strongly connected component is closed over exactly once and
+    after every component it references.
+    """
+    stale = self.__stale
+    if not stale:
+      return
+    self.__stale = set()
+    stats.incr('membership.refreshes')
+    stats.incr('membership.groups_refreshed',len(stale))
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    for root in stale:
+      if root in index:
+        continue
+      index[root] = lowlink[root] = len(index)
+      stack.append(root)
+      on_stack.add(root)
+      work = [(root,iter(self.__children.get(root,())))]
+      while work:
+        (node,children) = work[-1]
+        for child in children:
+          if child not in stale:
+            continue
+          if child not in index:
+            index[child] = lowlink[child] = len(index)
+            stack.append(child)
+            on_stack.add(child)
+            work.append((child,iter(self.__children.get(child,()))))
+            stats.maximum('membership.depth',len(work))
+            break
+          elif child in on_stack:
+            lowlink[node] = min(lowlink[node],index[child])
+        else:
+          work.pop()
+          if work:
+            parent = work[-1][0]
+            lowlink[parent] = min(lowlink[parent],lowlink[node])
+          if lowlink[node] == index[node]:
+            component = []
+            while True:
+              name = stack.pop()
+              on_stack.discard(name)
+              component.append(name)
+              if name == node:
+                break
+            self.__close(component)
+
+  def __close(self,component,):
+    """
+    Computes the shared member set of a strongly connected component,
+    every component it references has already been closed.
+    """
+    names = set(component)
+    members = set()
+    for name in component:
+      group = self.__groups.get(name)
+      if group is None:
+        continue
+      members.update(group.get_direct_members())
+      for child in self.__children[name]:
+        if child not in names:
+          members.update(self.__members.get(child,()))
+    members = frozenset(members)
+    for name in component:
+      if name in self.__groups:
+        self.__update(name,members)
+      else:
+        self.__update(name,frozenset())
+        del self.__members[name]
+
+  def __update(self,name,members,):
+    """
+    Stores the member set of a group, keeping the user to groups
+    mapping in step.
+    """
+    old = self.__members.get(name,frozenset())
+    if self.__changed is not None:
+      self.__changed.update(old ^ members)
+    for user in old - members:
+      containing = self.__containing[user]
+      containing.discard(name)
+      if not containing:
+        del self.__containing[user]
+    for user in members - old:
+      self.__containing.setdefault(user,set()).add(name)
+    self.__members[name] = members
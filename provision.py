@@ -0,0 +1,232 @@
+"""
+module author: Andrew Stucki
+
+Bulk provisioning of users from a manifest, one record per line either
+as CSV
+
+  alice,ssh-ed25519 AAAA... alice@host,devs qa
+
+or as JSON lines
+
+  {"user": "alice", "keys": ["ssh-ed25519 AAAA... alice@host"], "groups": ["devs", "qa"]}
+
+Users listed more than once get the keys and groups of every record.
+"""
+
+import os
+import sys
+import csv
+import json
+import logging
+import optparse
+
+from svndae import ssh, util
+from svndae.config import SvndaeConfig
+from svndae.group import isSafeGroupName
+
+log = logging.getLogger('svndae.app')
+
+DEFAULT_DIR = os.path.join('~','.svndae','svndae.conf')
+FORMATS = ('csv','jsonl')
+
+class ProvisionError(Exception):
+  """
+  Base class for provisioning errors
+  """
+
+class ManifestError(ProvisionError):
+  """
+  A manifest record is malformed
+  """
+
+class UnknownGroupError(ProvisionError):
+  """
+  A manifest record names a group that does not exist
+  """
+
+def _split(value,):
+  """
+  Returns the words of a CSV field, or the items of a JSON list.
+  """
+  if value is None:
+    return []
+  if isinstance(value,basestring):
+    return value.split()
+  return list(value)
+
+def _read_csv(lines,):
+  for (number,row) in enumerate(csv.reader(lines),1):
+    if not row or not ''.join(row).strip() or row[0].startswith('#'):
+      continue
+    if len(row) > 3:
+      raise ManifestError("Line %d: expected user,key,groups but got %d fields!" % (number,len(row)))
+    row = row + [''] * (3 - len(row))
+    keys = []
+    if row[1].strip():
+      keys.append(row[1].strip())
+    yield (number,row[0].strip(),keys,_split(row[2]))
+
+def _read_jsonl(lines,):
+  for (number,line) in enumerate(lines,1):
+    if not line.strip():
+      continue
+    try:
+      record = json.loads(line)
+    except ValueError, e:
+      raise ManifestError("Line %d: %s" % (number,e))
+    if not isinstance(record,dict):
+      raise ManifestError("Line %d: expected an object!" % number)
+    keys = _split(record.get('keys'))
+    if record.get('key'):
+      keys.append(record['key'])
+    yield (number,util.to_str(record.get('user') or ''),[util.to_str(key) for key in keys],[util.to_str(group) for group in _split(record.get('groups'))])
+
+def read_manifest(lines,format='csv',):
+  """
+  Parses manifest lines, returns a generator of (user, keys, groups)
+  with every key canonicalized. Raises ManifestError for bad user
+  names, group names and keys.
+  """
+  if format not in FORMATS:
+    raise ManifestError("Unknown manifest format '%s'!" % format)
+  if format == 'csv':
+    records = _read_csv(lines)
+  else:
+    records = _read_jsonl(lines)
+  for (number,user,keys,groups) in records:
+    if not ssh.isSafeUsername(user):
+      raise ManifestError("Line %d: the user name '%s' is not allowed!" % (number,user))
+    for group in groups:
+      if not isSafeGroupName(group):
+        raise ManifestError("Line %d: the group name '%s' is not allowed!" % (number,group))
+    canonical = [key for (_,key) in ssh.normalizeKeys([(user,key) for key in keys])]
+    if len(canonical) != len(keys):
+      raise ManifestError("Line %d: invalid or repeated key for '%s'!" % (number,user))
+    yield (user,canonical,groups)
+
+def collect_manifest(records,):
+  """
+  Merges the records of a manifest, returns ({user: keys},
+  {group: users}) keeping the order users first appeared in.
+  """
+  keys = {}
+  groups = {}
+  for (user,user_keys,user_groups) in records:
+    known = keys.setdefault(user,[])
+    for key in user_keys:
+      if key not in known:
+        known.append(key)
+    for group in user_groups:
+      members = groups.setdefault(group,[])
+      if not members or members[-1] != user:
+        members.append(user)
+  return (keys,groups)
+
+def write_key_file(keydir,user,keys,replace=False,):
+  """
+  Writes the public keys of a user to keydir/user.pub, adding them
+  to the keys already there unless replace is given. Returns whether
+  the file changed.
+  """
+  path = os.path.join(keydir,'%s.pub' % user)
+  existing = []
+  if os.path.exists(path):
+    existing = list(ssh.readKeyFile(path))
+  if replace:
+    lines = list(keys)
+  else:
+    seen = set()
+    for key in existing:
+      parsed = ssh.parseKey(key)
+      if parsed is not None:
+        seen.add(parsed[1])
+    lines = list(existing)
+    for key in keys:
+      if ssh.parseKey(key)[1] not in seen:
+        lines.append(key)
+  if lines == existing:
+    return False
+  with util.write_file(path,'w') as out:
+    for line in lines:
+      out.write('%s\n' % line)
+  return True
+
+def provision(cfg,records,replace=False,create_groups=False,):
+  """
+  Applies manifest records to a SvndaeConfig: every group membership
+  in a single configuration commit, then the key files. Returns the
+  number of users and of key files written.
+  """
+  (keys,groups) = collect_manifest(records)
+  def apply(cfg):
+    for group in sorted(groups):
+      if group not in cfg.groups:
+        if not create_groups:
+          raise UnknownGroupError("The group '%s' does not yet exist!" % group)
+        cfg.create_group(group)
+      missing = [user for user in groups[group] if not cfg.groups[group].has_member(user)]
+      if missing:
+        cfg.add_members_or_subgroups_to_group(missing,group)
+  cfg.update(apply)
+  keydir = cfg.get_conf_param(cfg._KEYDIR)
+  written = 0
+  for (user,user_keys) in keys.items():
+    if (user_keys or replace) and write_key_file(keydir,user,user_keys,replace):
+      written += 1
+  return (len(keys),written)
+
+class App(object):
+  name = None
+
+  def run(class_):
+    app = class_()
+    return app.main()
+  run = classmethod(run)
+
+  def main(self):
+    self.setup_basic_logging()
+    log.setLevel(logging.INFO)
+    parser = self.create_parser()
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+      parser.error('need a manifest file, or - for standard input')
+    format = options.format
+    if format is None:
+      format = args[0].endswith('.csv') and 'csv' or 'jsonl'
+      if args[0] == '-':
+        format = 'csv'
+    if args[0] == '-':
+      manifest = sys.stdin
+    else:
+      manifest = open(args[0])
+    (conf_path,conf_name) = os.path.split(options.conf)
+    cfg = SvndaeConfig(conf_path,name=conf_name,lazy=True)
+    try:
+      try:
+        (users,written) = provision(cfg,read_manifest(manifest,format),options.replace,options.create_groups)
+      finally:
+        manifest.close()
+    except ProvisionError, e:
+      log.error('%s', e)
+      return 1
+    log.info('Provisioned %d users, wrote %d key files', users, written)
+    from svndae.sync import App as SyncApp
+    SyncApp().sync(options.conf,options.workers)
+    return 0
+
+  def setup_basic_logging(self):
+    logging.basicConfig()
+
+  def create_parser(self):
+    parser = optparse.OptionParser(usage='%prog [options] MANIFEST')
+    parser.set_defaults(
+      conf=os.path.expanduser(DEFAULT_DIR),
+      replace=False,
+      create_groups=False,
+    )
+    parser.add_option('--conf',metavar='PATH',help='path to svndae configuration file',)
+    parser.add_option('--format',type='choice',choices=FORMATS,help='manifest format, csv or jsonl, by default from the file name',)
+    parser.add_option('--replace',action='store_true',help='replace the keys of listed users instead of adding to them',)
+    parser.add_option('--create-groups',action='store_true',help='create groups that do not exist yet',)
+    parser.add_option('-j','--workers',metavar='N',type='int',help='read key files with N threads',)
+    return parser
@@ -0,0 +1,100 @@
+"""
+module author: Andrew Stucki
+"""
+
+class ReferenceIndex:
+  """
+  Reverse lookups over what every group lists directly: the groups a
+  member is in, the groups a subgroup is part of and the groups granted
+  permissions on a repository. Kept up to date one group at a time.
+  """
+
+  def __init__(self,groups,):
+    """
+    Initialization method, groups maps group names to Group objects
+    and is consulted again whenever a group is updated.
+    """
+    self.__groups = groups
+    self.__records = {}
+    self.__members = {}
+    self.__parents = {}
+    self.__repos = {}
+    for name in groups.keys():
+      self.update(name)
+
+  # Public instance methods
+
+  def member_groups(self,member,):
+    """
+    Returns the groups listing member directly.
+    """
+    return frozenset(self.__members.get(member,()))
+
+  def parent_groups(self,group,):
+    """
+    Returns the groups listing group as a subgroup.
+    """
+    return frozenset(self.__parents.get(group,()))
+
+  def repo_groups(self,repo,type=None,):
+    """
+    Returns the groups granted the given permission type on repo, or
+    any permission type.
+    """
+    types = self.__repos.get(repo,{})
+    if type is not None:
+      return frozenset(types.get(type,()))
+    found = set()
+    for groups in types.values():
+      found.update(groups)
+    return frozenset(found)
+
+  def repo_permissions(self,repo,):
+    """
+    Returns {type: groups} for the permissions granted on repo.
+    """
+    return dict([(type,frozenset(groups)) for (type,groups) in self.__repos.get(repo,{}).items()])
+
+  def update(self,name,):
+    """
+    Records what a group lists now, also used when a group is created
+    or removed.
+    """
+    record = self.__records.pop(name,None)
+    if record is not None:
+      (members,subgroups,perms) = record
+      for member in members:
+        self.__discard(self.__members,member,name)
+      for subgroup in subgroups:
+        self.__discard(self.__parents,subgroup,name)
+      for (type,repos) in perms:
+        for repo in repos:
+          types = self.__repos[repo]
+          self.__discard(types,type,name)
+          if not types:
+            del self.__repos[repo]
+    group = self.__groups.get(name)
+    if group is None:
+      return
+    # a permission may list the same repository more than once
+    perms = tuple([(type,frozenset(repos)) for (type,repos) in group.get_permissions().items()])
+    record = (tuple(group.get_direct_members()),tuple(group.get_groups()),perms)
+    self.__records[name] = record
+    for member in record[0]:
+      self.__members.setdefault(member,set()).add(name)
+    for subgroup in record[1]:
+      self.__parents.setdefault(subgroup,set()).add(name)
+    for (type,repos) in perms:
+      for repo in repos:
+        self.__repos.setdefault(repo,{}).setdefault(type,set()).add(name)
+
+  # Private instance methods
+
+  def __discard(self,index,key,name,):
+    """
+    Removes name from the set stored under key, dropping empty sets.
+    """
+    names = index[key]
+    names.discard(name)
+    if not names:
+      del index[key]
@@ -27,3 +27,90 @@ class Repo:
     self.path = path
 
   # Public instance methods
+
+def _split_path(path,):
+  """
+  Returns the components of a path or URL, with '.' and '..' resolved
+  the way a request path would be.
+  """
+  if '://' in path:
+    import urlparse
+    path = urlparse.urlsplit(path)[2]
+  parts = []
+  for part in path.split('/'):
+    if part == '..':
+      if parts:
+        parts.pop()
+    elif part and part != '.':
+      parts.append(part)
+  return parts
+
+class RepoTrie:
+  """
+  Maps paths to the repository they belong to by longest prefix, one
+  dictionary per path component, so lookups take time proportional to
+  the depth of the path rather than the number of repositories.
+  """
+
+  def __init__(self,repos=(),):
+    """
+    Initialization method, repos is a list of Repo objects
+    """
+    self.__root = {}
+    for repo in repos:
+      self.add(repo)
+
+  # Public instance methods
+
+  def add(self,repo,):
+    """
+    Adds a Repo, repositories without a path are skipped.
+    """
+    if not repo.path:
+      return
+    node = self.__root
+    for part in _split_path(repo.path):
+      node = node.setdefault(part,{})
+    # None can not clash with a path component
+    node[None] = repo.name
+
+  def remove(self,repo,):
+    """
+    Removes a Repo, pruning the nodes no other repository needs.
+    """
+    if not repo.path:
+      return
+    trail = [self.__root]
+    parts = _split_path(repo.path)
+    for part in parts:
+      node = trail[-1].get(part)
+      if node is None:
+        return
+      trail.append(node)
+    if trail[-1].get(None) != repo.name:
+      return
+    del trail[-1][None]
+    for part in reversed(parts):
+      if trail.pop():
+        break
+      del trail[-1][part]
+
+  def resolve(self,path,):
+    """
+    Returns (repository name, path inside of the repository) for the
+    repository with the longest path containing path, or None.
+    """
+    parts = _split_path(path)
+    node = self.__root
+    found = None
+    if None in node:
+      found = (node[None],0)
+    for (depth,part) in enumerate(parts):
+      node = node.get(part)
+      if node is None:
+        break
+      if None in node:
+        found = (node[None],depth + 1)
+    if found is None:
+      return None
+    return (found[0],'/'.join(parts[found[1]:]))
@@ -0,0 +1,18 @@
+"""
+module author: Andrew Stucki
+"""
+
+import os
+
+def get_stat_stamp(st,):
+  """
+  Returns what identifies a version of the configuration file from its
+  stat, any rewrite through a rename changes the inode.
+  """
+  return (st.st_dev,st.st_ino,st.st_size,st.st_mtime)
+
+def get_stamp(path,):
+  """
+  Returns what identifies the current version of the configuration file
+  """
+  return get_stat_stamp(os.stat(path))
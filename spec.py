@@ -0,0 +1,171 @@
+"""
+module author: Andrew Stucki
+
+Declarative setup for svndae-init --from-spec, either as JSON
+
+  {"repos": {"trunk": "/srv/svn/trunk"},
+   "groups": {"devs": {"members": ["alice", "@qa"], "write": ["trunk"], "read": ["trunk"]}}}
+
+or as INI, with the sections of svndae.conf
+
+  [repo trunk]
+  path = /srv/svn/trunk
+
+  [group devs]
+  members = alice @qa
+  write = trunk
+  read = trunk
+"""
+
+import os
+
+from svndae.config import SvndaeConfig
+from svndae.group import isSafeGroupName
+from svndae.util import to_str
+
+_GROUP_PREFIX = 'group '
+_REPO_PREFIX = 'repo '
+_FIELDS = ('members',SvndaeConfig._WRITE,SvndaeConfig._READ)
+
+class SpecError(Exception):
+  """
+  The spec file is malformed or refers to things that do not exist
+  """
+
+def _words(value,):
+  """
+  Returns the words of an INI value, or the items of a JSON list, as str
+  """
+  if value is None:
+    return []
+  if isinstance(value,basestring):
+    return [to_str(word) for word in value.split()]
+  if not isinstance(value,list):
+    raise SpecError("Expected a list or a string but got '%s'!" % (to_str(value),))
+  return [to_str(word) for word in value]
+
+def _read_json(f,):
+  import json
+  try:
+    data = json.load(f)
+  except ValueError, e:
+    raise SpecError("Invalid JSON: %s" % e)
+  if not isinstance(data,dict):
+    raise SpecError("Expected an object with 'repos' and 'groups'!")
+  repos = data.get('repos') or {}
+  if isinstance(repos,list):
+    repos = dict([(name,None) for name in repos])
+  if not isinstance(repos,dict):
+    raise SpecError("Expected 'repos' to map names to paths!")
+  groups = data.get('groups') or {}
+  if not isinstance(groups,dict):
+    raise SpecError("Expected 'groups' to map names to members and permissions!")
+  spec = {'repos': [], 'groups': []}
+  for name in sorted(repos):
+    path = repos[name]
+    if isinstance(path,dict):
+      path = path.get('path')
+    spec['repos'].append((to_str(name),path and to_str(path) or None))
+  for name in sorted(groups):
+    fields = groups[name] or {}
+    if not isinstance(fields,dict):
+      raise SpecError("Expected the group '%s' to be an object!" % to_str(name))
+    spec['groups'].append((to_str(name),dict([(field,_words(fields.get(field))) for field in _FIELDS])))
+  return spec
+
+def _read_ini(f,path,):
+  import ConfigParser
+  parser = ConfigParser.RawConfigParser()
+  try:
+    parser.readfp(f,path)
+  except ConfigParser.Error, e:
+    raise SpecError("Invalid INI: %s" % e)
+  spec = {'repos': [], 'groups': []}
+  for section in parser.sections():
+    if section.startswith(_REPO_PREFIX):
+      repo_path = None
+      if parser.has_option(section,'path'):
+        repo_path = parser.get(section,'path') or None
+      spec['repos'].append((section[len(_REPO_PREFIX):],repo_path))
+    elif section.startswith(_GROUP_PREFIX):
+      fields = {}
+      for field in _FIELDS:
+        value = None
+        if parser.has_option(section,field):
+          value = parser.get(section,field)
+        fields[field] = _words(value)
+      spec['groups'].append((section[len(_GROUP_PREFIX):],fields))
+    else:
+      raise SpecError("Unknown section '%s'!" % section)
+  return spec
+
+def read_spec(path,):
+  """
+  Reads a JSON spec, for files ending in .json, or an INI spec.
+  Returns {'repos': [(name, path)], 'groups': [(name, {field: words})]}
+  with the members, write and read fields of every group.
+  """
+  f = open(path)
+  try:
+    if os.path.splitext(path)[1].lower() == '.json':
+      return _read_json(f)
+    return _read_ini(f,path)
+  finally:
+    f.close()
+
+def _check_name(kind,name,):
+  """
+  Makes sure a name is a single word that can not end a section
+  header, group and repository names may not start with '@' either.
+  """
+  if kind == 'group':
+    safe = isSafeGroupName(name)
+  else:
+    safe = name.split() == [name] and ']' not in name and (kind == 'member' or not name.startswith('@'))
+  if not safe:
+    raise SpecError("The %s name '%s' contains illegal characters!" % (kind,name))
+
+def check_spec(spec,repos=(),):
+  """
+  Makes sure every group, repository and member name is valid and every
+  permission of a spec is on a repository it defines, one of repos or
+  '@all'.
+  """
+  repos = set(repos)
+  for (name,path) in spec['repos']:
+    _check_name('repository',name)
+    repos.add(name)
+  for (name,fields) in spec['groups']:
+    _check_name('group',name)
+    for member in fields['members']:
+      _check_name('member',member)
+      if member.startswith('@'):
+        _check_name('group',member[1:])
+    for type in (SvndaeConfig._WRITE,SvndaeConfig._READ):
+      for repo in fields[type]:
+        if repo not in repos and repo != SvndaeConfig._ALL_REPOS:
+          raise SpecError("The group '%s' refers to the repository '%s', which is not defined!" % (name,repo))
+
+def apply_spec(config,spec,):
+  """
+  Adds the repositories, groups, members and permissions of a spec to a
+  SvndaeConfig in a single transaction, so the configuration file is
+  written once. Repositories and groups that exist are extended.
+  """
+  check_spec(spec,config.repos.keys())
+  with config.transaction():
+    for (name,path) in spec['repos']:
+      if name not in config.repos:
+        config.create_repo(name,path)
+    for (name,fields) in spec['groups']:
+      if name not in config.groups:
+        config.create_group(name)
+      group = config.groups[name]
+      missing = [member for member in fields['members'] if not group.has_member(member)]
+      if missing:
+        config.add_members_or_subgroups_to_group(missing,name)
+      perms = config.groups[name].get_permissions()
+      for type in (config._WRITE,config._READ):
+        for repo in fields[type]:
+          if repo not in perms.get(type,()):
+            config.add_permission(name,type,repo)
@@ -1,4 +1,11 @@
-import os, errno, re
+import os, errno, re, time, marshal, hashlib, binascii, itertools, struct
+
+from svndae import stats, util
+
+try:
+  from scandir import scandir
+except ImportError:
+  scandir = None
 
 _ACCEPTABLE_USER_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9_.-]*(@[a-zA-Z][a-zA-Z0-9.-]*)?$')
 
@@ -7,16 +14,36 @@ COMMENT = '### autogenerated by svndae, DO NOT EDIT'
 TEMPLATE=('command="svndae-filter %(user)s",no-port-forwarding,no-X11-forwarding,no-agent-forwarding,no-pty %(key)s')
 _COMMAND_RE = re.compile('^command="(/[^ "]+/)?svndae-filter [^"]+",no-port-forwarding,no-X11-forwarding,no-agent-forwarding,no-pty .*')
 
+KEY_TYPES = frozenset([
+  'ssh-rsa',
+  'ssh-dss',
+  'ssh-ed25519',
+  'ecdsa-sha2-nistp256',
+  'ecdsa-sha2-nistp384',
+  'ecdsa-sha2-nistp521',
+  'sk-ssh-ed25519@openssh.com',
+  'sk-ecdsa-sha2-nistp256@openssh.com',
+  ])
+
+MANIFEST = '.svndae-manifest'
+_MANIFEST_VERSION = 1
+
 def isSafeUsername(user):
   match = _ACCEPTABLE_USER_RE.match(user)
   return (match is not None)
 
-def readKeys(keydir):
+def listKeyFiles(keydir):
   """
-  Read SSH public keys from ``keydir/*.pub``
-  returns a generator for each of the key entries
+  List the SSH public key files in ``keydir``
+  returns a generator of (user, filename) sorted by filename, so the
+  first owner of a shared key is the same everywhere
   """
-  for filename in os.listdir(keydir):
+  if scandir is None:
+    filenames = os.listdir(keydir)
+  else:
+    # skips directories without a stat per entry on most filesystems
+    filenames = (entry.name for entry in scandir(keydir) if not entry.is_dir())
+  for filename in sorted(filenames):
     if filename.startswith('.'):
       continue
     basename, ext = os.path.splitext(filename)
@@ -24,13 +51,118 @@ def readKeys(keydir):
       continue
     if not isSafeUsername(basename):
       continue
-    path = os.path.join(keydir, filename)
-    f = file(path)
+    yield (basename, filename)
+
+def readKeyFile(path):
+  """
+  Read the lines of a single public key file
+  """
+  stats.incr('ssh.key_files_read')
+  f = file(path)
+  try:
     for line in f:
-      line = line.rstrip('\n')
-      yield (basename, line)
+      yield line.rstrip('\n')
+  finally:
     f.close()
 
+def _readKeyLines(path):
+  return list(readKeyFile(path))
+
+def readKeys(keydir, workers=None):
+  """
+  Read SSH public keys from ``keydir/*.pub``
+  returns a generator for each of the key entries
+  With ``workers``, that many threads read the key files ahead, which
+  pays off when every open is a network round trip; the entries come
+  out in the same order either way.
+  """
+  if not workers or workers < 2:
+    for (basename, filename) in listKeyFiles(keydir):
+      path = os.path.join(keydir, filename)
+      for line in readKeyFile(path):
+        yield (basename, line)
+    return
+  from multiprocessing.pool import ThreadPool
+  keyfiles = list(listKeyFiles(keydir))
+  paths = [os.path.join(keydir, filename) for (basename, filename) in keyfiles]
+  pool = ThreadPool(workers)
+  try:
+    contents = pool.imap(_readKeyLines, paths)
+    for ((basename, filename), lines) in itertools.izip(keyfiles, contents):
+      for line in lines:
+        yield (basename, line)
+  finally:
+    pool.terminate()
+
+def keyFingerprint(key):
+  """
+  Compute the OpenSSH SHA256 fingerprint of a ``type blob [comment]``
+  public key line, as sshd passes it to AuthorizedKeysCommand with %f
+  returns None when the key does not decode
+  """
+  parts = key.split()
+  if len(parts) < 2:
+    return None
+  try:
+    blob = binascii.a2b_base64(parts[1])
+  except binascii.Error:
+    return None
+  return _blobFingerprint(blob)
+
+def _blobFingerprint(blob):
+  digest = binascii.b2a_base64(hashlib.sha256(blob).digest())
+  return 'SHA256:%s' % digest.rstrip('\n=')
+
+def parseKey(line):
+  """
+  Parse a ``type blob [comment]`` public key line
+  returns (type, blob, comment) with the blob decoded, or None for
+  blank lines, comments, unknown key types and blobs that do not
+  decode to a key of the named type
+  """
+  parts = line.split(None, 2)
+  if len(parts) < 2 or parts[0] not in KEY_TYPES:
+    return None
+  try:
+    blob = binascii.a2b_base64(parts[1])
+  except binascii.Error:
+    return None
+  if len(blob) < 4:
+    return None
+  (length,) = struct.unpack('>I', blob[:4])
+  if blob[4:4+length] != parts[0]:
+    return None
+  comment = ''
+  if len(parts) > 2:
+    comment = ' '.join(parts[2].split())
+  return (parts[0], blob, comment)
+
+def normalizeKeys(keys, conflicts=None):
+  """
+  Validate the (user, key) pairs from ``readKeys``, dropping anything
+  ``parseKey`` rejects and keys that were already seen
+  returns a generator of (user, key) with the key in canonical form
+  A key claimed by several users only stays with the first one, like
+  sshd would pick the first matching line; the others are appended to
+  ``conflicts`` as (fingerprint, kept user, dropped user).
+  """
+  owners = {}
+  for (user, line) in keys:
+    key = parseKey(line)
+    if key is None:
+      continue
+    (type, blob, comment) = key
+    fingerprint = _blobFingerprint(blob)
+    owner = owners.get(fingerprint)
+    if owner is None:
+      owners[fingerprint] = user
+      canonical = '%s %s' % (type, binascii.b2a_base64(blob).rstrip('\n'))
+      if comment:
+        canonical = '%s %s' % (canonical, comment)
+      yield (user, canonical)
+    elif owner != user and conflicts is not None:
+      conflicts.append((fingerprint, owner, user))
+
 def generateAuthorizedKeys(keys):
   yield COMMENT
   for (user, key) in keys:
@@ -49,8 +181,89 @@ def filterAuthorizedKeys(fp):
       continue
     yield line
 
-def writeAuthorizedKeys(path, keydir):
-  tmp = '%s.%d.tmp' % (path, os.getpid())
+def _statFile(path):
+  try:
+    st = os.stat(path)
+  except OSError, e:
+    if e.errno == errno.ENOENT:
+      return None
+    raise
+  return (st.st_ino, st.st_size, st.st_mtime)
+
+def _hashFile(path):
+  stats.incr('ssh.key_files_hashed')
+  f = file(path, 'rb')
+  try:
+    return hashlib.sha1(f.read()).hexdigest()
+  finally:
+    f.close()
+
+def scanKeyFiles(keydir, previous=None, scanned=0):
+  """
+  Describe the key files in ``keydir`` as {filename: (mtime, size, sha1)}.
+  Files whose mtime and size match ``previous`` are not read again,
+  unless they were modified too close to the ``scanned`` time of
+  ``previous`` to be sure.
+  """
+  if previous is None:
+    previous = {}
+  files = {}
+  for (basename, filename) in listKeyFiles(keydir):
+    path = os.path.join(keydir, filename)
+    st = os.stat(path)
+    old = previous.get(filename)
+    if (old is not None and old[:2] == (st.st_mtime, st.st_size)
+        and st.st_mtime < scanned - 1):
+      files[filename] = old
+    else:
+      files[filename] = (st.st_mtime, st.st_size, _hashFile(path))
+  return files
+
+def readManifest(manifest):
+  """
+  Read the state recorded by the last incremental ``writeAuthorizedKeys``
+  returns (path, scanned, stat of path, files) or None
+  """
+  try:
+    f = file(manifest, 'rb')
+  except IOError, e:
+    if e.errno == errno.ENOENT:
+      return None
+    raise
+  try:
+    try:
+      data = marshal.load(f)
+    except (EOFError, ValueError, TypeError):
+      return None
+  finally:
+    f.close()
+  if not isinstance(data, tuple) or len(data) != 5 or data[0] != _MANIFEST_VERSION:
+    return None
+  return data[1:]
+
+def writeManifest(manifest, path, scanned, files):
+  with util.write_file(manifest) as out:
+    marshal.dump((_MANIFEST_VERSION, path, scanned, _statFile(path), files), out)
+
+def writeAuthorizedKeys(path, keydir, manifest=None, workers=None, normalize=False, conflicts=None):
+  """
+  Regenerate the svndae entries of the authorized_keys file at ``path``
+  from ``keydir``, keeping every other line.
+  With ``manifest``, the state of the key files and of ``path`` is kept
+  there and the file is left alone when neither changed.
+  ``workers`` is passed on to ``readKeys``. With ``normalize``, the keys
+  go through ``normalizeKeys``, which fills in ``conflicts``.
+  returns whether ``path`` was rewritten
+  """
+  if manifest is not None:
+    scanned = time.time()
+    state = readManifest(manifest)
+    if state is not None and state[0] == path:
+      files = scanKeyFiles(keydir, state[3], state[1])
+      if files == state[3] and _statFile(path) == state[2]:
+        return False
+    else:
+      files = scanKeyFiles(keydir)
   try:
     in_ = file(path)
   except IOError, e:
@@ -59,18 +272,20 @@ def writeAuthorizedKeys(path, keydir):
     else:
       raise
   try:
-    out = file(tmp, 'w')
-    try:
+    with util.write_file(path, 'w') as out:
       if in_ is not None:
         for line in filterAuthorizedKeys(in_):
           print >>out, line
-      keygen = readKeys(keydir)
+      keygen = readKeys(keydir, workers)
+      if normalize:
+        keygen = normalizeKeys(keygen, conflicts)
       for line in generateAuthorizedKeys(keygen):
         print >>out, line
-      os.fsync(out)
-    finally:
-      out.close()
+      stats.incr('ssh.authorized_keys_writes')
+      stats.incr('ssh.authorized_keys_bytes', out.tell())
   finally:
     if in_ is not None:
       in_.close()
-  os.rename(tmp, path)
+  if manifest is not None:
+    writeManifest(manifest, path, scanned, files)
+  return True
@@ -0,0 +1,162 @@
+"""
+module author: Andrew Stucki
+
+Optional counters and timers for the hot paths. Disabled unless the
+SVNDAE_STATS environment variable is set, or enable is called: '1' or
+'-' logs one JSON record per run to the svndae.app logger, anything else
+is taken as a file to append JSON lines to.
+
+Only imports what the hooks need, json and logging are loaded when
+there is something to emit.
+"""
+
+import os
+import sys
+import time
+import atexit
+
+ENV = 'SVNDAE_STATS'
+_LOGGER_TARGETS = ('1','-')
+
+_stats = None
+_target = None
+_registered = False
+
+class _NullTimer(object):
+  """
+  Timer handed out while instrumentation is disabled
+  """
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,*exc_info):
+    return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer(object):
+  """
+  Adds the time spent in a with block to a named timer
+  """
+
+  def __init__(self,name):
+    self.name = name
+
+  def __enter__(self):
+    self.started = time.time()
+    return self
+
+  def __exit__(self,*exc_info):
+    if _stats is not None:
+      timers = _stats['timers']
+      (count,seconds) = timers.get(self.name,(0,0.0))
+      timers[self.name] = (count + 1,seconds + time.time() - self.started)
+    return False
+
+def _get_log():
+  import logging
+  return logging.getLogger('svndae.app')
+
+def _reset():
+  global _stats
+  _stats = {'counters': {}, 'timers': {}, 'maximums': {}}
+
+def enabled():
+  """
+  Returns whether instrumentation is recording
+  """
+  return _stats is not None
+
+def enable(target='-',):
+  """
+  Starts recording, emit sends the record to target, see the module
+  documentation. Whatever was not emitted yet is emitted at exit.
+  """
+  global _target, _registered
+  _target = target
+  _reset()
+  if target in _LOGGER_TARGETS:
+    import logging
+    log = _get_log()
+    if not log.isEnabledFor(logging.INFO):
+      log.setLevel(logging.INFO)
+  if not _registered:
+    atexit.register(emit)
+    _registered = True
+
+def disable():
+  """
+  Stops recording, dropping what was not emitted.
+  """
+  global _stats
+  _stats = None
+
+def incr(name,count=1,):
+  """
+  Adds count to a named counter
+  """
+  if _stats is not None:
+    counters = _stats['counters']
+    counters[name] = counters.get(name,0) + count
+
+def maximum(name,value,):
+  """
+  Records value for a named maximum if it is the largest so far
+  """
+  if _stats is not None:
+    maximums = _stats['maximums']
+    if value > maximums.get(name,value - 1):
+      maximums[name] = value
+
+def timer(name,):
+  """
+  Returns a context manager timing its block under name
+  """
+  if _stats is None:
+    return _NULL_TIMER
+  return _Timer(name)
+
+def get_record():
+  """
+  Returns what was recorded since the last emit, or None when disabled
+  """
+  if _stats is None:
+    return None
+  timers = {}
+  for (name,(count,seconds)) in _stats['timers'].items():
+    timers[name] = {'count': count, 'seconds': seconds}
+  return {
+    'program': os.path.basename(sys.argv and sys.argv[0] or ''),
+    'pid': os.getpid(),
+    'time': time.time(),
+    'counters': dict(_stats['counters']),
+    'timers': timers,
+    'maximums': dict(_stats['maximums']),
+    }
+
+def emit():
+  """
+  Sends what was recorded since the last emit to the target and starts
+  over, does nothing when disabled or when nothing was recorded.
+  """
+  record = get_record()
+  if record is None or not (record['counters'] or record['timers'] or record['maximums']):
+    return
+  _reset()
+  import json
+  line = json.dumps(record,sort_keys=True)
+  if _target in _LOGGER_TARGETS:
+    _get_log().info('stats %s', line)
+    return
+  try:
+    out = open(_target,'a')
+    try:
+      out.write('%s\n' % line)
+    finally:
+      out.close()
+  except IOError, e:
+    _get_log().warning('Unable to write stats to %s: %s', _target, e)
+
+if os.environ.get(ENV):
+  enable(os.environ[ENV])
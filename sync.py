@@ -1,16 +1,16 @@
 import os
-import sys
 import logging
-import optparse
-import errno
-import ConfigParser
 
+# runs from cron, so only what every sync needs is imported here
+from svndae import stats
 from svndae.config import SvndaeConfig
-from svndae.ssh import writeAuthorizedKeys
+from svndae.ssh import MANIFEST, writeAuthorizedKeys
+from svndae.accesscache import update_access_cache
 
 log = logging.getLogger('svndae.app')
 
 DEFAULT_DIR = os.path.join('~','.svndae','svndae.conf')
+DEFAULT_DEBOUNCE = 1.0
 
 class App(object):
   name = None
@@ -24,19 +24,91 @@ class App(object):
     self.setup_basic_logging()
     parser = self.create_parser()
     (options, args) = parser.parse_args()
-    (conf_path,conf_name) = os.path.split(options.conf)
-    cfg = SvndaeConfig(conf_path,name=conf_name)
+    if options.watch:
+      log.setLevel(logging.INFO)
+    if options.stats:
+      stats.enable(options.stats)
+    keydir = self.sync(options.conf,options.workers)
+    if options.watch:
+      from svndae.watch import create_watcher, watch
+      watcher = create_watcher(keydir,options.conf)
+      log.info('Watching %s and %s for changes', keydir, options.conf)
+      try:
+        watch(watcher,lambda: self.sync_logged(options.conf,options.workers),debounce=options.debounce)
+      finally:
+        watcher.close()
+
+  def sync(self,conf,workers=None):
+    try:
+      with stats.timer('sync'):
+        return self.__sync(conf,workers)
+    finally:
+      stats.emit()
+
+  def __sync(self,conf,workers=None):
+    (conf_path,conf_name) = os.path.split(conf)
+    cfg = SvndaeConfig(conf_path,name=conf_name,lazy=True)
     path = cfg.get_conf_param('authorized_keys')
     keydir = cfg.get_conf_param('keydir')
-    writeAuthorizedKeys(path,keydir)
+    conflicts = []
+    if path and writeAuthorizedKeys(path,keydir,manifest=os.path.join(keydir,MANIFEST),workers=workers,normalize=True,conflicts=conflicts):
+      log.info('Regenerated %s', path)
+    for (fingerprint,owner,user) in conflicts:
+      log.warning('Key %s of %s is also claimed by %s, ignoring it for %s', fingerprint, owner, user, user)
+    index = cfg.get_key_index()
+    if index:
+      from svndae.keyindex import update_key_index
+      if update_key_index(index,keydir):
+        log.info('Updated %s', index)
+    authz = cfg.get_authz()
+    if authz:
+      from svndae.authz import write_authz
+      if write_authz(authz,cfg):
+        log.info('Regenerated %s', authz)
+    self.__sync_svnserve(cfg,authz)
+    update_access_cache(cfg)
+    return keydir
+
+  def __sync_svnserve(self,cfg,authz):
+    """
+    Writes the svnserve configuration svndae-filter runs svnserve with,
+    or removes it when the authz file or the repository root is not
+    configured, so svndae-filter refuses to run svnserve unconfined.
+    """
+    from svndae.filter import get_svnserve_conf_path
+    path = get_svnserve_conf_path(cfg.get_full_path())
+    root = cfg.get_svnroot()
+    if authz and root:
+      from svndae.authz import write_svnserve_conf
+      if write_svnserve_conf(path,authz,root):
+        log.info('Regenerated %s', path)
+    elif os.path.exists(path):
+      os.unlink(path)
+      log.warning('Removed %s, svndae-filter needs both %s and %s', path, cfg._AUTHZ, cfg._SVNROOT)
+
+  def sync_logged(self,conf,workers=None):
+    """
+    Syncs without letting a bad edit stop the watcher.
+    """
+    try:
+      self.sync(conf,workers)
+    except Exception:
+      log.exception('Unable to sync from %s', conf)
 
   def setup_basic_logging(self):
     logging.basicConfig()
 
   def create_parser(self):
+    import optparse
     parser = optparse.OptionParser()
     parser.set_defaults(
       conf=os.path.expanduser(DEFAULT_DIR),
+      watch=False,
+      debounce=DEFAULT_DEBOUNCE,
     )
     parser.add_option('--conf',metavar='PATH',help='path to svndae configuration file',)
+    parser.add_option('-w','--watch',action='store_true',help='keep running and sync whenever keys or configuration change',)
+    parser.add_option('-j','--workers',metavar='N',type='int',help='read key files with N threads',)
+    parser.add_option('--stats',metavar='PATH',help='record timings and counters, logged for -, appended to PATH as JSON lines otherwise',)
+    parser.add_option('--debounce',metavar='SECONDS',type='float',help='how long changes must settle before syncing in watch mode',)
     return parser
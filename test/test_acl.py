@@ -0,0 +1,105 @@
+import os
+from nose.tools import eq_ as eq, assert_raises, assert_true
+
+from svndae.config import *
+from svndae.acl import AccessMatrix
+from svndae.test import util
+
+def test_access_compiled():
+  tmp = util.maketemp()
+  util.writeFile(os.path.join(tmp,'svndae.conf'),'''\
+[svndae]
+
+[group admins]
+members = root
+write = @all
+read = @all
+
+[group devs]
+members = alice @qa
+write = trunk
+read = trunk docs
+
+[group qa]
+members = bob
+
+[repo trunk]
+path = /srv/svn/trunk
+
+[repo docs]
+path = /srv/svn/docs
+''')
+  cfg_file = SvndaeConfig(tmp)
+  assert_true(cfg_file.has_access('alice','trunk','write'))
+  assert_true(cfg_file.has_access('bob','docs','read'))
+  assert_true(not cfg_file.has_access('bob','docs','write'))
+  assert_true(cfg_file.has_access('root','docs','write'))
+  assert_true(not cfg_file.has_access('root','norepo','read'))
+  assert_true(not cfg_file.has_access('nobody','trunk','read'))
+  assert_raises(BadPermissionError,cfg_file.has_access,'alice','trunk','badperm')
+  eq(cfg_file.get_user_repos('bob'),['docs','trunk'])
+  eq(cfg_file.get_user_repos('bob','write'),['trunk'])
+  eq(cfg_file.get_user_repos('nobody'),[])
+
+  # the compiled tables can be reloaded without a configuration
+  matrix = AccessMatrix(*cfg_file.get_access_matrix().get_tables())
+  assert_true(matrix.can('alice','trunk','write'))
+  assert_true(matrix.can('root','docs','read'))
+  eq(matrix.get_repos('bob','write'),['trunk'])
+
+def test_access_incremental():
+  tmp = util.maketemp()
+  util.writeFile(os.path.join(tmp,'svndae.conf'),'''\
+[svndae]
+
+[group admins]
+members = root
+write = @all
+read = @all
+
+[group devs]
+members = alice @qa
+write = trunk
+read = trunk docs
+
+[group qa]
+members = bob
+
+[repo trunk]
+path = /srv/svn/trunk
+
+[repo docs]
+path = /srv/svn/docs
+''')
+  cfg_file = SvndaeConfig(tmp)
+  assert_true(not cfg_file.has_access('bob','docs','write'))
+
+  # permission changes
+  cfg_file.add_permission('qa','write','docs')
+  assert_true(cfg_file.has_access('bob','docs','write'))
+  assert_true(not cfg_file.has_access('alice','docs','write'))
+  cfg_file.unset_permission('devs','write','trunk')
+  assert_true(not cfg_file.has_access('alice','trunk','write'))
+  assert_true(cfg_file.has_access('alice','trunk','read'))
+
+  # write access implies read access
+  cfg_file.create_repo('branches')
+  cfg_file.add_permission('qa','write','branches')
+  assert_true(cfg_file.has_access('bob','branches','read'))
+  eq(cfg_file.get_user_repos('bob','read'),['branches','docs','trunk'])
+  cfg_file.remove_repo('branches')
+
+  # membership changes
+  cfg_file.remove_member_or_subgroup_from_group('@qa','devs')
+  eq(cfg_file.get_user_repos('bob'),['docs'])
+  cfg_file.add_member_or_subgroup_to_group('bob','admins')
+  assert_true(cfg_file.has_access('bob','trunk','write'))
+  cfg_file.remove_group('admins')
+  assert_true(not cfg_file.has_access('root','trunk','read'))
+
+  # repositories
+  cfg_file.create_repo('branches')
+  cfg_file.add_permission('qa','read','branches')
+  eq(cfg_file.get_user_repos('bob'),['branches','docs'])
+  cfg_file.remove_repo('branches')
+  eq(cfg_file.get_user_repos('bob'),['docs'])
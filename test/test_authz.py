@@ -0,0 +1,130 @@
+import os
+from nose.tools import eq_ as eq, assert_true
+
+from svndae import authz, filter, sync
+from svndae.config import SvndaeConfig
+from svndae.test import util
+
+def test_generate_authz():
+  tmp = util.maketemp()
+  util.writeFile(os.path.join(tmp,'svndae.conf'),'''\
+[svndae]
+
+[group admins]
+members = root
+write = @all
+read = @all
+
+[group devs]
+members = alice @qa @gone
+write = trunk
+read = trunk docs nowhere
+
+[group qa]
+members = bob
+write =
+read = docs
+
+[group a]
+members = carol @b
+write =
+read =
+
+[group b]
+members = dave @a
+write =
+read =
+
+[group c]
+members = @a
+write =
+read =
+
+[repo trunk]
+
+[repo docs]
+''')
+  cfg = SvndaeConfig(tmp)
+  eq(authz.generate_authz(cfg),[
+    authz.COMMENT,
+    '[groups]',
+    'a = carol, dave',
+    'admins = root',
+    'b = carol, dave',
+    'c = carol, dave',
+    'devs = alice, @qa',
+    'qa = bob',
+    '',
+    '[/]',
+    '@admins = rw',
+    '',
+    '[docs:/]',
+    '@devs = r',
+    '@qa = r',
+    '',
+    '[trunk:/]',
+    '@devs = rw',
+    ])
+
+  path = os.path.join(tmp,'authz')
+  assert_true(authz.write_authz(path,cfg))
+  eq(util.readFile(path).splitlines(),authz.generate_authz(cfg))
+  st = os.stat(path)
+  assert_true(not authz.write_authz(path,cfg))
+  eq(os.stat(path).st_ino,st.st_ino)
+  cfg.add_member_or_subgroup_to_group('erin','qa')
+  assert_true(authz.write_authz(path,cfg))
+  assert_true('qa = bob, erin' in util.readFile(path).splitlines())
+
+def test_svnserve_conf():
+  tmp = util.maketemp()
+  keydir = os.path.join(tmp,'keydir')
+  os.mkdir(keydir)
+  conf = os.path.join(tmp,'svndae.conf')
+  authz_path = os.path.join(tmp,'authz')
+  util.writeFile(conf,'''\
+[svndae]
+keydir = %s
+authorized_keys = %s
+authz = %s
+svnroot = /srv/svn
+
+[group devs]
+members = alice
+write = trunk
+read =
+
+[repo trunk]
+''' % (keydir,os.path.join(tmp,'authorized_keys'),authz_path))
+  sync.App().sync(conf)
+  path = filter.get_svnserve_conf_path(conf)
+  eq(util.readFile(path).splitlines(),[
+    authz.COMMENT,
+    '[general]',
+    'anon-access = none',
+    'auth-access = write',
+    'authz-db = %s' % authz_path,
+    '',
+    '[svndae]',
+    'root = /srv/svn',
+    ])
+  assert_true('[trunk:/]' in util.readFile(authz_path).splitlines())
+
+
+  # svnserve knows repositories by their directory below the root
+  cfg = SvndaeConfig(tmp)
+  cfg.create_repo('docs','/srv/svn/documentation')
+  cfg.create_repo('tools','/opt/tools')
+  cfg.create_repo('web','web')
+  for repo in ('trunk','docs','tools','web'):
+    cfg.add_permission('devs','read',repo)
+  lines = authz.generate_authz(cfg)
+  assert_true('[trunk:/]' in lines)
+  assert_true('[documentation:/]' in lines)
+  assert_true('[web:/]' in lines)
+  assert_true('[tools:/]' not in lines and '[docs:/]' not in lines)
+
+  # without an authz file svnserve is not configured at all
+  util.writeFile(conf,util.readFile(conf).replace('authz = %s\n' % authz_path,''))
+  sync.App().sync(conf)
+  assert_true(not os.path.exists(path))
@@ -0,0 +1,52 @@
+from nose.tools import eq_ as eq, assert_raises, assert_true
+
+import sys
+from cStringIO import StringIO
+
+from svndae import benchmark
+from svndae.config import SvndaeConfig
+from svndae.test.util import maketemp, readFile
+
+def test_run_benchmarks():
+  tmp = maketemp()
+  results = benchmark.run_benchmarks(tmp,users=20,groups=6,depth=3,repos=4,queries=50)
+  eq(sorted(results),['clean_config','compile_access','expand','has_access','load','load_lazy','sync','sync_unchanged'])
+  eq(results['has_access']['ops'],50)
+  assert_true(results['load']['peak_kb'] > 0)
+
+  # groups nest in chains of three
+  cfg = SvndaeConfig(tmp)
+  eq(cfg.groups['group0'].get_groups(),['group1'])
+  eq(cfg.groups['group2'].get_groups(),[])
+  eq(sorted(cfg.expand_group_membership('group0')),['user0','user1','user12','user13','user14','user18','user19','user2','user6','user7','user8'])
+  eq(len(readFile(tmp + '/authorized_keys').splitlines()),21)
+
+  # the keydir size is independent of the number of users
+  tmp = maketemp()
+  results = benchmark.run_benchmarks(tmp,users=20,groups=6,depth=3,repos=4,queries=50,keys=30)
+  eq(results['sync']['ops'],30)
+  eq(len(readFile(tmp + '/authorized_keys').splitlines()),31)
+
+def test_measure():
+  # every benchmark has its own peak memory
+  big = benchmark.measure(lambda: len('x' * (64 * 1024 * 1024)),1)
+  small = benchmark.measure(lambda: None,1)
+  assert_true(small['peak_kb'] < big['peak_kb'] - 32 * 1024)
+  def failing():
+    raise ValueError('broken')
+  stderr = sys.stderr
+  sys.stderr = StringIO()
+  try:
+    assert_raises(benchmark.BenchmarkError,benchmark.measure,failing,1)
+  finally:
+    sys.stderr = stderr
+
+def test_compare():
+  baseline = {'load': {'ops_per_sec': 100.0, 'peak_kb': 1000}, 'sync': {'ops_per_sec': 100.0}}
+  results = {'load': {'ops_per_sec': 90.0, 'peak_kb': 1100}, 'sync': {'ops_per_sec': 50.0, 'peak_kb': 1000}, 'expand': {'ops_per_sec': 1.0}}
+  eq(benchmark.compare(results,baseline),[('sync','ops_per_sec',100.0,50.0)])
+  eq(benchmark.compare(results,baseline,threshold=0.05),[
+    ('load','ops_per_sec',100.0,90.0),
+    ('load','peak_kb',1000,1100),
+    ('sync','ops_per_sec',100.0,50.0),
+    ])
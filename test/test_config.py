@@ -2,8 +2,10 @@ import os
 from nose.tools import eq_ as eq, assert_raises, assert_true
 from ConfigParser import RawConfigParser
 
+from svndae import stats
 from svndae.config import *
-from svndae.group import IllegalMemberError,IllegalGroupError
+from svndae.group import Group,IllegalMemberError,IllegalGroupError
+from svndae.membership import MembershipReport
 from svndae.test import util
 
 def test_non_existant_config():
@@ -125,8 +127,16 @@ def test_config_group_functions():
   eq(cfg_file.groups['testgroup3'].get_groups(),['testgroup3','testgroup2'])
   eq(cfg_file.expand_group_membership('testgroup3'),['testmember','testmember3','testmember2'])
   cfg_file.add_member_or_subgroup_to_group('@nogroup','testgroup')
-  eq(cfg_file.expand_group_membership('testgroup'),['testmember'])
+  report = MembershipReport()
+  mtime = os.stat(path).st_mtime
+  eq(cfg_file.expand_group_membership('testgroup',report),['testmember'])
+  eq(cfg_file.expand_group_membership('testgroup2',report),['testmember','testmember2'])
+  eq(report.dangling,[('testgroup','nogroup')])
+  assert_true('nogroup' in tgroup.get_groups())
+  eq(os.stat(path).st_mtime,mtime)
+  cfg_file.repair_membership(report)
   assert_true('nogroup' not in tgroup.get_groups())
+  assert_true(not cfg_file.check_membership())
   assert_raises(NonExistantGroupError,cfg_file.expand_group_membership,'nogroup')
 
   # add_permission test
@@ -160,5 +170,430 @@ def test_clean_config():
   cfg_file = SvndaeConfig(tmp)
 
   assert_true('nonexistant' in cfg_file.groups['testgroup'].get_groups())
-  cfg_file.clean_config()
+  original = open(path).read()
+  report = cfg_file.clean_config(dry_run=True)
+  eq(report.subgroups,[('testgroup','nonexistant')])
+  eq(report.permissions,[('testgroup','write','norepo')])
+  eq(open(path).read(),original)
+  assert_true('nonexistant' in cfg_file.groups['testgroup'].get_groups())
+
+  report = cfg_file.clean_config()
+  eq(report.subgroups,[('testgroup','nonexistant')])
   assert_true('nonexistant' not in cfg_file.groups['testgroup'].get_groups())
+  written = SvndaeConfig(tmp)
+  eq(written.groups['testgroup'].get_groups(),[])
+  eq(written.groups['testgroup'].get_permissions()['write'],['testrepo'])
+  assert_true(not cfg_file.clean_config())
+
+def test_config_transaction():
+  tmp = util.maketemp()
+  cfg = RawConfigParser()
+  cfg.add_section('svndae')
+  cfg.add_section('group testgroup')
+  cfg.set('group testgroup','members','testmember')
+  cfg.set('group testgroup','write','')
+  cfg.set('group testgroup','read','')
+
+  path = os.path.join(tmp,'svndae.conf')
+  cfg.write(open(path,'wb'))
+  cfg_file = SvndaeConfig(tmp)
+  original = open(path).read()
+
+  # nothing is written until the transaction commits
+  with cfg_file.transaction():
+    cfg_file.create_group('newgroup')
+    cfg_file.add_members_or_subgroups_to_group(['john','jane'],'newgroup')
+    cfg_file.add_member_or_subgroup_to_group('@newgroup','testgroup')
+    eq(open(path).read(),original)
+  written = RawConfigParser()
+  written.read(path)
+  eq(written.get('group newgroup','members'),'john jane')
+  eq(written.get('group testgroup','members'),'testmember @newgroup')
+
+  # a failing transaction leaves both the file and the objects untouched
+  committed = open(path).read()
+  def failing():
+    with cfg_file.transaction():
+      cfg_file.create_group('badgroup')
+      cfg_file.remove_group('nonexistant')
+  assert_raises(NonExistantGroupError,failing)
+  assert_true('badgroup' not in cfg_file.groups.keys())
+  eq(open(path).read(),committed)
+  eq(sorted(cfg_file.expand_group_membership('newgroup')),['jane','john'])
+
+  # an inner rollback only undoes what changed since the inner begin
+  with cfg_file.transaction():
+    cfg_file.create_repo('testrepo','/srv/svn/testrepo')
+    cfg_file.add_permission('newgroup','write','testrepo')
+    def failing():
+      with cfg_file.transaction():
+        cfg_file.add_member_or_subgroup_to_group('jim','newgroup')
+        cfg_file.unset_permission('newgroup','write','testrepo')
+        cfg_file.remove_group('testgroup')
+        cfg_file.remove_repo('testrepo')
+        cfg_file.remove_group('nonexistant')
+    assert_raises(NonExistantGroupError,failing)
+    eq(cfg_file.groups['newgroup'].get_direct_members(),['john','jane'])
+    eq(cfg_file.groups['newgroup'].get_permissions()['write'],['testrepo'])
+    eq(sorted(cfg_file.groups.keys()),['newgroup','testgroup'])
+    eq(cfg_file.repos['testrepo'].path,'/srv/svn/testrepo')
+    eq(cfg_file.get_user_repos('jane','write'),['testrepo'])
+  written = SvndaeConfig(tmp)
+  eq(written.groups['testgroup'].get_groups(),['newgroup'])
+  eq(written.groups['newgroup'].get_permissions()['write'],['testrepo'])
+  eq(written.repos['testrepo'].path,'/srv/svn/testrepo')
+
+def test_membership_index():
+  tmp = util.maketemp()
+  cfg = RawConfigParser()
+  cfg.add_section('svndae')
+  cfg.add_section('group a')
+  cfg.add_section('group b')
+  cfg.add_section('group c')
+  cfg.add_section('group d')
+  cfg.set('group a','members','alice @b')
+  cfg.set('group b','members','bob @c')
+  cfg.set('group c','members','carol @a')
+  cfg.set('group d','members','dave @c')
+
+  path = os.path.join(tmp,'svndae.conf')
+  cfg.write(open(path,'wb'))
+  cfg_file = SvndaeConfig(tmp)
+
+  # a, b and c form a cycle and share their members
+  for group in ['a','b','c']:
+    eq(sorted(cfg_file.expand_group_membership(group)),['alice','bob','carol'])
+  eq(sorted(cfg_file.expand_group_membership('d')),['alice','bob','carol','dave'])
+  eq(sorted(cfg_file.expand_user_membership('alice')),['a','b','c','d'])
+  eq(sorted(cfg_file.expand_user_membership('dave')),['d'])
+  eq(cfg_file.expand_user_membership('nobody'),[])
+
+  # breaking the cycle only updates the groups containing the change
+  cfg_file.remove_member_or_subgroup_from_group('@a','c')
+  eq(sorted(cfg_file.expand_group_membership('c')),['carol'])
+  eq(sorted(cfg_file.expand_group_membership('a')),['alice','bob','carol'])
+  eq(sorted(cfg_file.expand_user_membership('alice')),['a'])
+  cfg_file.add_member_or_subgroup_to_group('erin','c')
+  eq(sorted(cfg_file.expand_group_membership('d')),['carol','dave','erin'])
+  eq(sorted(cfg_file.expand_user_membership('erin')),['a','b','c','d'])
+
+  # removing a group drops it from every expansion and every group
+  cfg_file.remove_group('c')
+  eq(sorted(cfg_file.expand_group_membership('a')),['alice','bob'])
+  eq(sorted(cfg_file.expand_user_membership('carol')),[])
+  eq(cfg_file.groups['d'].get_groups(),[])
+  eq(cfg_file.check_membership().dangling,[])
+  cfg_file.add_members_or_subgroups_to_group(['@x','@y'],'b')
+  eq(sorted(cfg_file.check_membership().dangling),[('b','x'),('b','y')])
+  cfg_file.repair_membership()
+  eq(cfg_file.groups['b'].get_groups(),[])
+
+def test_group_storage():
+  group = Group('testgroup')
+  assert_raises(AttributeError,setattr,group,'unknown',1)
+  eq(group._add_members(['b','a','@sub','a','@sub','c']),['b','a','c','@sub'])
+  eq(group.get_direct_members(),['b','a','c'])
+  eq(group.get_groups(),['sub'])
+  assert_true(group.has_member('@sub') and group.has_member('a'))
+  assert_true(not group.has_member('sub'))
+
+  # removing members keeps the order and the subgroups
+  eq(group._remove_member('a'),['b','c','@sub'])
+  assert_raises(ValueError,group._remove_member,'a')
+  eq(group._remove_members(['c','@sub','@nosub','nobody']),['b'])
+  eq(group._add_member('a'),['b','a'])
+  eq(group.get_direct_members(),['b','a'])
+  eq(group.get_groups(),[])
+
+def test_config_lazy():
+  tmp = util.maketemp()
+  cfg = RawConfigParser()
+  cfg.add_section('svndae')
+  cfg.add_section('group testgroup')
+  cfg.add_section('group testgroup2')
+  cfg.add_section('repo testrepo')
+  cfg.set('group testgroup','members','testmember @testgroup2')
+  cfg.set('group testgroup2','members','testmember2')
+  cfg.set('repo testrepo','path','/srv/svn/testrepo')
+
+  path = os.path.join(tmp,'svndae.conf')
+  cfg.write(open(path,'wb'))
+  original = open(path).read()
+  cfg_file = SvndaeConfig(tmp,lazy=True)
+
+  # nothing is set up or written back until asked for
+  eq(dict.__len__(cfg_file.groups),0)
+  eq(len(cfg_file.groups),2)
+  eq(sorted(cfg_file.groups.keys()),['testgroup','testgroup2'])
+  assert_true('testgroup2' in cfg_file.groups)
+  eq(cfg_file.groups['testgroup2'].get_direct_members(),['testmember2'])
+  eq(dict.__len__(cfg_file.groups),1)
+  eq(cfg_file.repos['testrepo'].path,'/srv/svn/testrepo')
+  eq(open(path).read(),original)
+
+  # everything else behaves as usual
+  eq(sorted(cfg_file.expand_group_membership('testgroup')),['testmember','testmember2'])
+  def failing():
+    with cfg_file.transaction():
+      cfg_file.remove_group('testgroup')
+      cfg_file.remove_group('nonexistant')
+  assert_raises(NonExistantGroupError,failing)
+  assert_true('testgroup' in cfg_file.groups)
+  cfg_file.remove_group('testgroup2')
+  eq(sorted(cfg_file.groups.keys()),['testgroup'])
+  eq(SvndaeConfig(tmp).groups.keys(),['testgroup'])
+
+def test_config_write_changed_sections():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  util.writeFile(path,'''\
+# managed by svndae
+[svndae]
+keydir = /srv/keys
+authorized_keys = /home/svn/.ssh/authorized_keys
+
+; the people who run things
+[group admins]
+members = root
+write = @all
+read   =   @all
+
+[group devs]
+# developers
+members = alice
+write = trunk
+read = trunk
+
+# repositories below
+[repo trunk]
+path = /srv/svn/trunk
+''')
+  cfg_file = SvndaeConfig(tmp)
+  cfg_file.add_member_or_subgroup_to_group('bob','devs')
+  cfg_file.create_group('qa')
+  eq(util.readFile(path),'''\
+# managed by svndae
+[svndae]
+keydir = /srv/keys
+authorized_keys = /home/svn/.ssh/authorized_keys
+
+; the people who run things
+[group admins]
+members = root
+write = @all
+read   =   @all
+
+[group devs]
+# developers
+members = alice bob
+write = trunk
+read = trunk
+
+# repositories below
+[repo trunk]
+path = /srv/svn/trunk
+
+[group qa]
+members = 
+
+''')
+  cfg_file.remove_group('devs')
+  eq(util.readFile(path),'''\
+# managed by svndae
+[svndae]
+keydir = /srv/keys
+authorized_keys = /home/svn/.ssh/authorized_keys
+
+; the people who run things
+[group admins]
+members = root
+write = @all
+read   =   @all
+
+[repo trunk]
+path = /srv/svn/trunk
+
+[group qa]
+members = 
+
+''')
+  eq(SvndaeConfig(tmp).groups['admins'].get_permissions()['read'],['@all'])
+
+def test_config_write_defaults_and_comments():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  util.writeFile(path,'''\
+[DEFAULT]
+read = docs
+
+[svndae]
+keydir = /srv/keys
+
+[group devs]
+; keep alice first
+members = alice
+# trunk only
+write = trunk
+# no options below
+
+[repo trunk]
+
+[repo docs]
+''')
+  cfg_file = SvndaeConfig(tmp)
+  eq(cfg_file.groups['devs'].get_permissions()['read'],['docs'])
+  cfg_file.add_member_or_subgroup_to_group('bob','devs')
+  cfg_file.add_permission('devs','write','docs')
+  # the defaults stay in [DEFAULT] and the comments stay in place
+  eq(util.readFile(path),'''\
+[DEFAULT]
+read = docs
+
+[svndae]
+keydir = /srv/keys
+
+[group devs]
+; keep alice first
+members = alice bob
+# trunk only
+write = trunk docs
+# no options below
+
+[repo trunk]
+
+[repo docs]
+''')
+  eq(SvndaeConfig(tmp).groups['devs'].get_permissions(),{'write': ['trunk','docs'], 'read': ['docs']})
+
+def test_config_concurrent_writers():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  util.writeFile(path,'[svndae]\n\n[group devs]\nmembers = alice\nwrite = \nread = \n')
+  first = SvndaeConfig(tmp)
+  second = SvndaeConfig(tmp)
+  first.add_member_or_subgroup_to_group('bob','devs')
+  eq(first.get_stamp(),SvndaeConfig(tmp).get_stamp())
+
+  # the second writer read an older version and must not overwrite it
+  assert_raises(ConfigConflictError,second.add_member_or_subgroup_to_group,'carol','devs')
+  eq(second.groups['devs'].get_direct_members(),['alice'])
+  eq(SvndaeConfig(tmp).groups['devs'].get_direct_members(),['alice','bob'])
+
+  second.reload()
+  second.add_member_or_subgroup_to_group('carol','devs')
+  eq(SvndaeConfig(tmp).groups['devs'].get_direct_members(),['alice','bob','carol'])
+
+  # update retries the change against the current file
+  first.update(lambda cfg: cfg.add_member_or_subgroup_to_group('dave','devs'))
+  eq(SvndaeConfig(tmp).groups['devs'].get_direct_members(),['alice','bob','carol','dave'])
+  with first.transaction():
+    assert_raises(ConfigTransactionError,first.reload)
+
+def test_config_reverse_indexes():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  util.writeFile(path,'''\
+[svndae]
+
+[group devs]
+members = alice bob
+write = trunk
+read = trunk docs
+
+[group qa]
+members = bob @devs
+write =
+read = docs
+
+[repo trunk]
+
+[repo docs]
+''')
+  cfg_file = SvndaeConfig(tmp)
+  eq(cfg_file.get_member_groups('bob'),['devs','qa'])
+  eq(cfg_file.get_member_groups('@devs'),['qa'])
+  eq(cfg_file.get_repo_groups('docs'),['devs','qa'])
+  eq(cfg_file.get_repo_groups('trunk','write'),['devs'])
+  assert_raises(BadPermissionError,cfg_file.get_repo_groups,'trunk','execute')
+
+  # mutations keep the indexes current
+  cfg_file.remove_member_or_subgroup_from_group('bob','devs')
+  eq(cfg_file.get_member_groups('bob'),['qa'])
+  cfg_file.add_permission('qa','write','trunk')
+  eq(cfg_file.get_repo_groups('trunk','write'),['devs','qa'])
+
+  # removals clean up the references to what was removed
+  cfg_file.remove_repo('docs')
+  eq(cfg_file.get_repo_groups('docs'),[])
+  eq(cfg_file.groups['devs'].get_permissions()['read'],['trunk'])
+  eq(cfg_file.groups['qa'].get_permissions()['read'],[])
+  cfg_file.remove_group('devs')
+  eq(cfg_file.get_member_groups('@devs'),[])
+  eq(cfg_file.get_member_groups('alice'),[])
+  reread = SvndaeConfig(tmp)
+  eq(reread.groups['qa'].get_direct_members(),['bob'])
+  eq(reread.groups['qa'].get_permissions(),{'write': ['trunk'], 'read': []})
+  eq(reread.check_membership().dangling,[])
+
+def test_config_duplicate_permissions():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  util.writeFile(path,'''\
+[svndae]
+
+[group devs]
+members = alice
+write =
+read = trunk trunk
+
+[group qa]
+members = @devs
+write = trunk
+read = trunk
+
+[repo trunk]
+''')
+  cfg_file = SvndaeConfig(tmp)
+  cfg_file.add_permission('qa','write','trunk')
+  eq(cfg_file.get_repo_groups('trunk'),['devs','qa'])
+  cfg_file.remove_group('devs')
+  eq(cfg_file.get_repo_groups('trunk'),['qa'])
+  cfg_file.remove_repo('trunk')
+  eq(cfg_file.get_repo_groups('trunk'),[])
+  eq(SvndaeConfig(tmp).groups['qa'].get_permissions(),{'write': [], 'read': []})
+
+def test_config_remove_cost():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  lines = ['[svndae]','','[repo trunk]','','[group devs]','members = alice','write = trunk','read =','']
+  for n in range(200):
+    lines.extend(['[group other%d]' % n,'members = user%d' % n,'write =','read =',''])
+  lines.extend(['[group qa]','members = bob @devs','write = trunk','read =',''])
+  util.writeFile(path,'\n'.join(lines))
+  cfg_file = SvndaeConfig(tmp)
+  # removing only saves and writes what refers to the removed entry
+  stats.enable(os.path.join(tmp,'stats.json'))
+  try:
+    cfg_file.remove_group('devs')
+    cfg_file.remove_repo('trunk')
+    record = stats.get_record()
+  finally:
+    stats.disable()
+  eq(record['counters']['config.undo_records'],8)
+  eq(record['counters']['config.sections_written'],4)
+  eq(cfg_file.groups['qa'].get_groups(),[])
+  eq(cfg_file.groups['qa'].get_permissions()['write'],[])
+  eq(len(cfg_file.groups),201)
+
+def test_group_storage_compaction():
+  group = Group('testgroup')
+  group._add_members(['m%d' % n for n in range(10)])
+  group._remove_members(['m%d' % n for n in range(0,10,2)])
+  eq(group.get_direct_members(),['m1','m3','m5','m7','m9'])
+  group._remove_member('m5')
+  group._add_members(['m0','m5'])
+  eq(group.get_direct_members(),['m1','m3','m7','m9','m0','m5'])
+  copied = group._copy()
+  group._remove_member('m1')
+  eq(copied.get_direct_members(),['m1','m3','m7','m9','m0','m5'])
+  eq(group.get_direct_members(),['m3','m7','m9','m0','m5'])
@@ -0,0 +1,49 @@
+import os
+import threading
+from nose.tools import eq_ as eq, assert_raises
+
+from svndae import daemon, filter
+from svndae.config import SvndaeConfig
+from svndae.test import util
+
+def test_daemon():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  util.writeFile(path,'''\
+[svndae]
+
+[group devs]
+members = alice
+write = trunk
+read = trunk
+
+[repo trunk]
+path = /srv/svn/trunk
+''')
+  socket_path = filter.get_socket_path(path)
+  assert_raises(filter.DaemonUnavailableError,filter.query_daemon,socket_path,'alice')
+  # without a daemon the filter loads the configuration itself
+  eq(filter.get_user_repos(path,'alice'),['trunk'])
+
+  server = daemon.AccessServer(socket_path,path)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.start()
+  try:
+    eq(filter.query_daemon(socket_path,'alice'),['trunk'])
+    eq(filter.query_daemon(socket_path,'alice','write'),['trunk'])
+    eq(filter.query_daemon(socket_path,'bob'),[])
+    assert_raises(filter.DaemonUnavailableError,filter.query_daemon,socket_path,'alice','execute')
+
+    # changes to the configuration file are picked up right away
+    cfg_file = SvndaeConfig(*os.path.split(path))
+    cfg_file.add_member_or_subgroup_to_group('bob','devs')
+    eq(filter.get_user_repos(path,'bob'),['trunk'])
+  finally:
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+  # a socket left behind is taken over
+  server = daemon.AccessServer(socket_path,path)
+  server.server_close()
+  os.unlink(socket_path)
@@ -0,0 +1,108 @@
+import os
+import sys
+from cStringIO import StringIO
+from nose.tools import eq_ as eq, assert_raises, assert_true
+
+from svndae import accesscache, authz, filter
+from svndae.config import SvndaeConfig
+from svndae.test import util
+
+def test_check_command():
+  filter.check_command('svnserve -t')
+  filter.check_command(' svnserve  -t ')
+  assert_raises(filter.MissingCommandError,filter.check_command,None)
+  assert_raises(filter.CommandNotAllowedError,filter.check_command,'svnserve -d')
+  assert_raises(filter.CommandNotAllowedError,filter.check_command,'svnserve -t; rm -rf /')
+  assert_raises(filter.CommandNotAllowedError,filter.check_command,'bash')
+
+def test_parse_args():
+  app = filter.App()
+  eq(app.parse_args(['--conf','/x/svndae.conf','jdoe']),('/x/svndae.conf','jdoe'))
+  eq(app.parse_args(['--conf=/x/svndae.conf','jdoe']),('/x/svndae.conf','jdoe'))
+  eq(app.parse_args(['jdoe'])[1],'jdoe')
+  assert_raises(ValueError,app.parse_args,[])
+  assert_raises(ValueError,app.parse_args,['jdoe','extra'])
+
+def test_access_cache():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  util.writeFile(path,'''\
+[svndae]
+
+[group devs]
+members = alice
+write = trunk
+read = trunk
+
+[repo trunk]
+path = /srv/svn/trunk
+''')
+  eq(accesscache.read_user_access(path,'alice'),None)
+
+  # the first check compiles the configuration and fills the cache
+  assert_true(filter.load_user_access(path,'alice').can('alice','trunk','write'))
+  cached = accesscache.read_user_access(path,'alice')
+  eq(cached.get_repos('alice'),['trunk'])
+  eq(accesscache.read_user_access(path,'bob').get_repos('bob'),[])
+
+  # any change to the configuration file makes it stale
+  cfg_file = SvndaeConfig(*os.path.split(path))
+  cfg_file.create_group('admins')
+  cfg_file.add_member_or_subgroup_to_group('bob','admins')
+  cfg_file.add_permission('admins','read','@all')
+  eq(accesscache.read_user_access(path,'bob'),None)
+  eq(filter.load_user_access(path,'bob').get_repos('bob','read'),['trunk'])
+  eq(accesscache.read_user_access(path,'bob').get_repos('bob','write'),[])
+
+  # syncing an unchanged file leaves the cache alone
+  st = os.stat(accesscache.get_cache_path(path))
+  assert_true(not accesscache.update_access_cache(SvndaeConfig(*os.path.split(path),lazy=True)))
+  eq(os.stat(accesscache.get_cache_path(path)).st_ino,st.st_ino)
+
+  # a damaged cache is ignored
+  util.writeFile(accesscache.get_cache_path(path),'garbage')
+  eq(accesscache.read_user_access(path,'bob'),None)
+
+def _run_filter(path,user):
+  calls = []
+  saved = (os.execvp,sys.argv,sys.stderr,os.environ.get('SSH_ORIGINAL_COMMAND'))
+  os.execvp = lambda file,args: calls.append((file,args))
+  sys.argv = ['svndae-filter','--conf',path,user]
+  sys.stderr = StringIO()
+  os.environ['SSH_ORIGINAL_COMMAND'] = 'svnserve -t'
+  try:
+    status = filter.App().main()
+    return (status,calls,sys.stderr.getvalue())
+  finally:
+    (os.execvp,sys.argv,sys.stderr,command) = saved
+    if command is None:
+      del os.environ['SSH_ORIGINAL_COMMAND']
+    else:
+      os.environ['SSH_ORIGINAL_COMMAND'] = command
+
+def test_main():
+  tmp = util.maketemp()
+  path = os.path.join(tmp,'svndae.conf')
+  util.writeFile(path,'''\
+[svndae]
+
+[group devs]
+members = alice
+write = trunk
+read = trunk
+
+[repo trunk]
+path = /srv/svn/trunk
+''')
+  conf = filter.get_svnserve_conf_path(path)
+
+  # svnserve is never run without an authz file and a root
+  (status,calls,error) = _run_filter(path,'alice')
+  eq((status,calls),(1,[]))
+  assert_true('svnroot' in error)
+  authz.write_svnserve_conf(conf,os.path.join(tmp,'authz'),'/srv/svn')
+
+  eq(_run_filter(path,'alice')[:2],(None,[('svnserve',[
+    'svnserve','-t','-r','/srv/svn','--config-file',conf,'--tunnel-user=alice',
+    ])]))
+  eq(_run_filter(path,'bob')[:2],(1,[]))
@@ -0,0 +1,53 @@
+import os
+import sys
+import subprocess
+from nose.tools import eq_ as eq, assert_true
+
+import svndae
+
+# seconds a fresh interpreter may spend importing an entry point
+IMPORT_BUDGET = 0.25
+
+_SCRIPT = '''\
+import sys, time
+started = time.time()
+import %s
+print time.time() - started
+print ' '.join(sorted(name for (name,module) in sys.modules.items() if module is not None))
+'''
+
+def _import(module):
+  """
+  Imports module in a fresh interpreter, returns (seconds, loaded modules)
+  """
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(svndae.__file__)))
+  env.pop('SVNDAE_STATS',None)
+  process = subprocess.Popen([sys.executable,'-c',_SCRIPT % module],stdout=subprocess.PIPE,env=env)
+  (out,_) = process.communicate()
+  eq(process.returncode,0)
+  (seconds,modules) = out.splitlines()
+  return (float(seconds),set(modules.split()))
+
+def _check(module,forbidden):
+  (seconds,modules) = _import(module)
+  eq(sorted(modules & set(forbidden)),[])
+  assert_true(seconds < IMPORT_BUDGET,'importing %s took %.3fs' % (module,seconds))
+
+def test_filter_imports():
+  _check('svndae.filter',[
+    'ConfigParser','optparse','logging','json','sqlite3','SocketServer',
+    'svndae.config','svndae.snapshot','svndae.accesscache',
+    ])
+
+def test_lookup_imports():
+  _check('svndae.lookup',['ConfigParser','optparse','logging','svndae.config'])
+
+def test_sync_imports():
+  _check('svndae.sync',[
+    'optparse','json','svndae.watch','svndae.keyindex','svndae.authz',
+    'svndae.interactive_init',
+    ])
+
+def test_init_imports():
+  _check('svndae.init',['svndae.interactive_init','init'])
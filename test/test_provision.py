@@ -0,0 +1,73 @@
+from nose.tools import eq_ as eq, assert_raises, assert_true
+
+import os
+import json
+
+from svndae.config import SvndaeConfig
+from svndae import provision
+from svndae.test.util import mkdir, maketemp, writeFile, readFile
+from svndae.test.test_ssh import VALID_1, VALID_2
+
+def _setup():
+  tmp = maketemp()
+  keydir = os.path.join(tmp,'keydir')
+  mkdir(keydir)
+  writeFile(os.path.join(tmp,'svndae.conf'),'''\
+[svndae]
+keydir = %s
+
+[group devs]
+members = alice
+write =
+read =
+''' % keydir)
+  return (tmp,keydir)
+
+def test_read_manifest():
+  records = list(provision.read_manifest([
+    '# user,key,groups\n',
+    'jdoe,%s,devs qa\n' % VALID_1,
+    'wsmith,,\n',
+    ]))
+  eq(records,[('jdoe',[VALID_1],['devs','qa']),('wsmith',[],[])])
+  records = list(provision.read_manifest([
+    json.dumps({'user': 'jdoe', 'keys': [VALID_1, VALID_2], 'groups': ['devs']}),
+    '',
+    ],'jsonl'))
+  eq(records,[('jdoe',[VALID_1,VALID_2],['devs'])])
+  assert_raises(provision.ManifestError,list,provision.read_manifest(['bad user,,devs\n']))
+  assert_raises(provision.ManifestError,list,provision.read_manifest(['jdoe,ssh-rsa AAAA,devs\n']))
+  assert_raises(provision.ManifestError,list,provision.read_manifest(['{"user": "jdoe"'],'jsonl'))
+  for groups in ('ops]x','@admins'):
+    assert_raises(provision.ManifestError,list,provision.read_manifest(['jdoe,,%s\n' % groups]))
+  assert_raises(provision.ManifestError,list,provision.read_manifest([json.dumps({'user': 'jdoe', 'groups': ['ops team']})],'jsonl'))
+
+  # non-ASCII text is kept as UTF-8, and rejected where it is not allowed
+  key = '%s jos\xc3\xa9@host' % ' '.join(VALID_1.split()[:2])
+  records = list(provision.read_manifest([json.dumps({'user': 'jdoe', 'key': key.decode('utf-8')})],'jsonl'))
+  eq(records,[('jdoe',[key],[])])
+  assert_raises(provision.ManifestError,list,provision.read_manifest([json.dumps({'user': u'jos\xe9'})],'jsonl'))
+
+def test_provision():
+  (tmp,keydir) = _setup()
+  cfg = SvndaeConfig(tmp,lazy=True)
+  records = [
+    ('jdoe',[VALID_1],['devs','qa']),
+    ('wsmith',[VALID_2],['devs']),
+    ('jdoe',[VALID_1],['devs']),
+    ]
+  assert_raises(provision.UnknownGroupError,provision.provision,cfg,records)
+  eq(os.listdir(keydir),[])
+
+  eq(provision.provision(cfg,records,create_groups=True),(2,2))
+  written = SvndaeConfig(tmp)
+  eq(written.groups['devs'].get_direct_members(),['alice','jdoe','wsmith'])
+  eq(written.groups['qa'].get_direct_members(),['jdoe'])
+  eq(readFile(os.path.join(keydir,'jdoe.pub')),'%s\n' % VALID_1)
+
+  # keys are added to what is there, or replace it
+  eq(provision.provision(cfg,[('jdoe',[VALID_2],[])]),(1,1))
+  eq(readFile(os.path.join(keydir,'jdoe.pub')),'%s\n%s\n' % (VALID_1,VALID_2))
+  eq(provision.provision(cfg,[('jdoe',[VALID_2],[])]),(1,0))
+  eq(provision.provision(cfg,[('jdoe',[VALID_2],[])],replace=True),(1,1))
+  eq(readFile(os.path.join(keydir,'jdoe.pub')),'%s\n' % VALID_2)
@@ -0,0 +1,31 @@
+import os
+from nose.tools import eq_ as eq, assert_true
+
+from svndae.config import SvndaeConfig
+from svndae.repository import Repo, RepoTrie
+from svndae.test import util
+
+def test_repo_trie():
+  trie = RepoTrie([Repo('svn','/srv/svn'),Repo('trunk','/srv/svn/trunk'),Repo('nowhere')])
+  eq(trie.resolve('/srv/svn/trunk/src/main.c'),('trunk','src/main.c'))
+  eq(trie.resolve('/srv/svn/trunk'),('trunk',''))
+  eq(trie.resolve('/srv/svn/trunkish'),('svn','trunkish'))
+  eq(trie.resolve('svn+ssh://host/srv/svn/trunk/./a//b'),('trunk','a/b'))
+  eq(trie.resolve('/srv/svn/trunk/../docs'),('svn','docs'))
+  eq(trie.resolve('/srv'),None)
+  trie.remove(Repo('trunk','/srv/svn/trunk'))
+  eq(trie.resolve('/srv/svn/trunk/src'),('svn','trunk/src'))
+  trie.remove(Repo('svn','/srv/svn'))
+  eq(trie.resolve('/srv/svn/trunk/src'),None)
+
+def test_config_resolve_repo():
+  tmp = util.maketemp()
+  util.writeFile(os.path.join(tmp,'svndae.conf'),'[svndae]\n\n[repo trunk]\npath = /srv/svn/trunk\n')
+  cfg = SvndaeConfig(tmp,lazy=True)
+  eq(cfg.resolve_repo('/srv/svn/trunk/src'),('trunk','src'))
+  cfg.create_repo('tags','/srv/svn/trunk/tags')
+  eq(cfg.resolve_repo('/srv/svn/trunk/tags/1.0'),('tags','1.0'))
+  cfg.remove_repo('tags')
+  eq(cfg.resolve_repo('/srv/svn/trunk/tags/1.0'),('trunk','tags/1.0'))
+  cfg.remove_repo('trunk')
+  eq(cfg.resolve_repo('/srv/svn/trunk/src'),None)
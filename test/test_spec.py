@@ -0,0 +1,74 @@
+import os
+import json
+import time
+from nose.tools import eq_ as eq, assert_raises, assert_true
+
+from svndae import spec
+from svndae.config import SvndaeConfig
+from svndae.test import util
+
+def test_read_spec():
+  tmp = util.maketemp()
+  ini = os.path.join(tmp,'spec.ini')
+  util.writeFile(ini,'''\
+[repo trunk]
+path = /srv/svn/trunk
+
+[repo docs]
+
+[group devs]
+members = alice @qa
+write = trunk
+read = trunk docs
+
+[group qa]
+members = bob
+''')
+  path = os.path.join(tmp,'spec.json')
+  util.writeFile(path,json.dumps({
+    'repos': {'trunk': '/srv/svn/trunk', 'docs': None},
+    'groups': {
+      'devs': {'members': ['alice','@qa'], 'write': ['trunk'], 'read': 'trunk docs'},
+      'qa': {'members': ['bob']},
+      },
+    }))
+  parsed = spec.read_spec(ini)
+  eq(sorted(parsed['repos']),[('docs',None),('trunk','/srv/svn/trunk')])
+  eq(sorted(parsed['groups']),sorted(spec.read_spec(path)['groups']))
+  eq(dict(parsed['groups'])['devs'],{'members': ['alice','@qa'], 'write': ['trunk'], 'read': ['trunk','docs']})
+
+  util.writeFile(ini,'[group devs]\nwrite = nowhere\n')
+  assert_raises(spec.SpecError,spec.check_spec,spec.read_spec(ini))
+  for bad in ({'groups': {'a]b': {}}},{'groups': {'@devs': {}}},{'repos': ['a]b']},{'groups': {'devs': {'members': ['john doe']}}},{'groups': {'devs': {'members': ['@a]b']}}}):
+    util.writeFile(path,json.dumps(bad))
+    assert_raises(spec.SpecError,spec.check_spec,spec.read_spec(path))
+  util.writeFile(ini,'[other]\n')
+  assert_raises(spec.SpecError,spec.read_spec,ini)
+
+  # non-ASCII text is read as UTF-8
+  util.writeFile(path,json.dumps({'groups': {u'd\xe9vs': {'members': [u'jos\xe9']}}}))
+  eq(spec.read_spec(path)['groups'],[('d\xc3\xa9vs',{'members': ['jos\xc3\xa9'], 'write': [], 'read': []})])
+
+def test_apply_spec():
+  tmp = util.maketemp()
+  SvndaeConfig.generate_config(tmp,'svndae.conf','keys',os.path.join(tmp,'authorized_keys'))
+  cfg = SvndaeConfig(tmp)
+  parsed = {
+    'repos': [('repo%d' % n,'/srv/svn/repo%d' % n) for n in range(2000)],
+    'groups': [('group%d' % n,{'members': ['user%d' % n,'@group%d' % (n - n % 10)], 'write': ['repo%d' % n], 'read': ['repo%d' % n,'@all']}) for n in range(1000)],
+    }
+  started = time.time()
+  spec.apply_spec(cfg,parsed)
+  assert_true(time.time() - started < 10)
+  written = SvndaeConfig(tmp)
+  eq(len(written.repos),2000)
+  eq(written.repos['repo7'].path,'/srv/svn/repo7')
+  eq(written.groups['group998'].get_permissions(),{'write': ['repo998'], 'read': ['repo998','@all']})
+  assert_true(written.has_access('user999','repo3','read'))
+  assert_true(written.has_access('user10','repo15','write'))
+  assert_true(not written.has_access('user15','repo10','write'))
+
+  # applying it again changes nothing
+  st = os.stat(os.path.join(tmp,'svndae.conf'))
+  spec.apply_spec(written,parsed)
+  eq(os.stat(os.path.join(tmp,'svndae.conf')).st_ino,st.st_ino)
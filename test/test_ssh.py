@@ -1,9 +1,11 @@
 from nose.tools import eq_ as eq, assert_raises
 
 import os
+import struct
+import binascii
 from cStringIO import StringIO
 
-from svndae import ssh
+from svndae import ssh, keyindex
 from svndae.test.util import mkdir, maketemp, writeFile, readFile
 
 def _key(s):
@@ -23,6 +25,13 @@ ZwIAo7y/BU7cD3Y9UdVZykG34NiijHZLlCBo/TnobXjFIPXvFbfgQ3y8g+akwocFVcQ= f
 roop@snoop
 """)
 
+def _validKey(type, data, comment):
+  blob = struct.pack('>I', len(type)) + type + data
+  return '%s %s %s' % (type, binascii.b2a_base64(blob).rstrip('\n'), comment)
+
+VALID_1 = _validKey('ssh-ed25519', '\0\0\0\x20' + 'a'*32, 'jdoe@host')
+VALID_2 = _validKey('ssh-rsa', '\0\0\0\x03\x01\x00\x01' + 'b'*64, 'wsmith@host')
+
 class ReadKeys_Test(object):
   def test_empty(self):
     tmp = maketemp()
@@ -92,6 +101,17 @@ class ReadKeys_Test(object):
        ('jdoe', KEY_2),
        ]))
 
+  def test_workers(self):
+    tmp = maketemp()
+    keydir = os.path.join(tmp, 'many')
+    mkdir(keydir)
+    for i in range(50):
+      writeFile(os.path.join(keydir, 'user%d.pub' % i), '%s\n%s\n' % (KEY_1, KEY_2))
+    writeFile(os.path.join(keydir, '.hidden.pub'), KEY_1+'\n')
+    serial = list(ssh.readKeys(keydir=keydir))
+    eq(len(serial), 100)
+    eq(list(ssh.readKeys(keydir=keydir, workers=8)), serial)
+
 class GenerateAuthorizedKeys_Test(object):
   def test_simple(self):
     def k():
@@ -189,3 +209,106 @@ baz
 command="svndae-filter jdoe",no-port-forwarding,\
 no-X11-forwarding,no-agent-forwarding,no-pty %(key_1)s
 ''' % dict(key_1=KEY_1))
+
+  def test_incremental(self):
+    tmp = maketemp()
+    path = os.path.join(tmp, 'authorized_keys')
+    writeFile(path, '# foo\n')
+    keydir = os.path.join(tmp, 'keys')
+    mkdir(keydir)
+    manifest = os.path.join(keydir, ssh.MANIFEST)
+    writeFile(os.path.join(keydir, 'jdoe.pub'), KEY_1+'\n')
+    eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir, manifest=manifest), True)
+    first = readFile(path)
+    eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir, manifest=manifest), False)
+    eq(readFile(path), first)
+
+    # a new key gives the same file as a full rewrite
+    writeFile(os.path.join(keydir, 'wsmith.pub'), KEY_2+'\n')
+    eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir, manifest=manifest), True)
+    incremental = readFile(path)
+    eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir, manifest=manifest), False)
+    ssh.writeAuthorizedKeys(path=path, keydir=keydir)
+    eq(readFile(path), incremental)
+
+    # removed keys and outside edits are noticed too
+    os.unlink(os.path.join(keydir, 'wsmith.pub'))
+    eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir, manifest=manifest), True)
+    eq(readFile(path), first)
+    writeFile(path, '# bar\n')
+    eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir, manifest=manifest), True)
+    eq(readFile(path), first.replace('# foo', '# bar'))
+
+class KeyFingerprint_Test(object):
+  def test_simple(self):
+    # as printed by ssh-keygen -l
+    key = 'ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIGX/6WEvOkCntnXyBGBKRdqqv+ycrAkIZJUZxywj6NlS jdoe@host'
+    eq(ssh.keyFingerprint(key), 'SHA256:+FhmMXPbOEXDwvMlRFkRTYF5nKqA4TejBzZmtIv4gjs')
+
+  def test_bad(self):
+    eq(ssh.keyFingerprint(''), None)
+    eq(ssh.keyFingerprint('ssh-rsa'), None)
+    eq(ssh.keyFingerprint('ssh-rsa abc'), None)
+
+class NormalizeKeys_Test(object):
+  def test_parse(self):
+    eq(ssh.parseKey(VALID_1)[0], 'ssh-ed25519')
+    eq(ssh.parseKey(VALID_1)[2], 'jdoe@host')
+    eq(ssh.parseKey(''), None)
+    eq(ssh.parseKey('# a comment'), None)
+    eq(ssh.parseKey(KEY_1), None)
+    eq(ssh.parseKey(VALID_1.replace('ssh-ed25519', 'ssh-rsa', 1)), None)
+    eq(ssh.parseKey('from="10.0.0.1" %s' % VALID_1), None)
+
+  def test_simple(self):
+    conflicts = []
+    got = list(ssh.normalizeKeys([
+      ('jdoe', ''),
+      ('jdoe', '# my laptop'),
+      ('jdoe', '  %s  ' % VALID_1.replace(' jdoe', '  jdoe')),
+      ('jdoe', 'garbage'),
+      ('jdoe', VALID_1),
+      ('wsmith', VALID_2),
+      ('wsmith', VALID_1),
+      ], conflicts))
+    eq(got, [('jdoe', VALID_1), ('wsmith', VALID_2)])
+    eq(conflicts, [(ssh.keyFingerprint(VALID_1), 'jdoe', 'wsmith')])
+
+class KeyIndex_Test(object):
+  def test_simple(self):
+    tmp = maketemp()
+    index = os.path.join(tmp, 'keys.db')
+    keydir = os.path.join(tmp, 'keys')
+    mkdir(keydir)
+    eq(keyindex.lookup_key(index, ssh.keyFingerprint(VALID_1)), [])
+    writeFile(os.path.join(keydir, 'jdoe.pub'), VALID_1+'\n')
+    writeFile(os.path.join(keydir, 'wsmith.pub'), VALID_2+'\n')
+    eq(keyindex.update_key_index(index, keydir), 2)
+    eq(keyindex.lookup_key(index, ssh.keyFingerprint(VALID_1)), [
+       'command="svndae-filter jdoe",no-port-forwarding,no-X11-f'
+       +'orwarding,no-agent-forwarding,no-pty %s' % VALID_1])
+    eq(keyindex.update_key_index(index, keydir), 0)
+
+    # only the changed files are indexed again
+    writeFile(os.path.join(keydir, 'jdoe.pub'), VALID_2+'\n')
+    os.unlink(os.path.join(keydir, 'wsmith.pub'))
+    eq(keyindex.update_key_index(index, keydir), 2)
+    eq(keyindex.lookup_key(index, ssh.keyFingerprint(VALID_1)), [])
+    eq(keyindex.lookup_key(index, ssh.keyFingerprint(VALID_2)), [
+       'command="svndae-filter jdoe",no-port-forwarding,no-X11-f'
+       +'orwarding,no-agent-forwarding,no-pty %s' % VALID_2])
+
+  def test_shared_key(self):
+    # a shared key belongs to the first user, as in authorized_keys
+    tmp = maketemp()
+    index = os.path.join(tmp, 'keys.db')
+    keydir = os.path.join(tmp, 'keys')
+    mkdir(keydir)
+    writeFile(os.path.join(keydir, 'zed.pub'), VALID_1+'\n')
+    writeFile(os.path.join(keydir, 'amy.pub'), VALID_1+'\n')
+    keyindex.update_key_index(index, keydir)
+    path = os.path.join(tmp, 'authorized_keys')
+    conflicts = []
+    ssh.writeAuthorizedKeys(path, keydir, normalize=True, conflicts=conflicts)
+    eq(keyindex.lookup_key(index, ssh.keyFingerprint(VALID_1)), readFile(path).splitlines()[1:])
+    eq(conflicts, [(ssh.keyFingerprint(VALID_1), 'amy', 'zed')])
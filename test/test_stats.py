@@ -0,0 +1,39 @@
+from nose.tools import eq_ as eq, assert_true
+
+import os
+import json
+
+from svndae import stats
+from svndae.config import SvndaeConfig
+from svndae.test.util import maketemp, writeFile, readFile
+
+def test_stats():
+  tmp = maketemp()
+  path = os.path.join(tmp,'stats.json')
+  writeFile(os.path.join(tmp,'svndae.conf'),'[svndae]\n\n[group devs]\nmembers = alice @qa\nwrite =\nread =\n\n[group qa]\nmembers = bob\nwrite =\nread =\n')
+  stats.enable(path)
+  try:
+    cfg = SvndaeConfig(tmp)
+    cfg.expand_group_membership('devs')
+    cfg.add_member_or_subgroup_to_group('carol','qa')
+    with stats.timer('test'):
+      pass
+    stats.emit()
+    # nothing new, nothing written
+    stats.emit()
+  finally:
+    stats.disable()
+  lines = readFile(path).splitlines()
+  eq(len(lines),1)
+  record = json.loads(lines[0])
+  eq(record['counters']['config.loads'],1)
+  eq(record['counters']['config.writes'],1)
+  eq(record['counters']['config.sections_written'],1)
+  eq(record['counters']['membership.expand_calls'],1)
+  eq(record['maximums']['membership.depth'],2)
+  eq(record['timers']['test']['count'],1)
+  assert_true(record['counters']['config.bytes_written'] > 0)
+
+  # disabled, nothing is recorded
+  stats.incr('config.loads')
+  eq(stats.get_record(),None)
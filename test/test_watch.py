@@ -0,0 +1,61 @@
+import os
+from nose.tools import eq_ as eq, assert_true
+
+from svndae import watch
+from svndae.test.util import mkdir, maketemp, writeFile
+
+class FakeWatcher(object):
+  """
+  Replays a list of changes, True for a change within the timeout
+  """
+  def __init__(self, changes):
+    self.changes = list(changes)
+
+  def wait(self, timeout=None):
+    if not self.changes:
+      raise StopIteration()
+    return self.changes.pop(0)
+
+def _setup(tmp):
+  keydir = os.path.join(tmp, 'keys')
+  mkdir(keydir)
+  conf = os.path.join(tmp, 'svndae.conf')
+  writeFile(conf, '[svndae]\n')
+  return (keydir, conf)
+
+def test_debounce():
+  calls = []
+  # a burst of three changes, then a single change
+  watcher = FakeWatcher([True, True, True, False, True, False])
+  try:
+    watch.watch(watcher, lambda: calls.append(1), debounce=0)
+  except StopIteration:
+    pass
+  eq(len(calls), 2)
+
+def check_watcher(create):
+  tmp = maketemp()
+  (keydir, conf) = _setup(tmp)
+  watcher = create(keydir, conf)
+  try:
+    eq(watcher.wait(0), False)
+    writeFile(os.path.join(keydir, '.svndae-manifest'), 'ignored')
+    writeFile(os.path.join(keydir, 'jdoe.txt'), 'ignored')
+    eq(watcher.wait(0.1), False)
+    writeFile(os.path.join(keydir, 'jdoe.pub'), 'key\n')
+    assert_true(watcher.wait(2))
+    writeFile(conf, '[svndae]\nkeydir = keys\n')
+    assert_true(watcher.wait(2))
+  finally:
+    watcher.close()
+
+def test_polling():
+  check_watcher(lambda keydir, conf: watch.PollingWatcher(keydir, conf, interval=0.05))
+
+def test_inotify():
+  try:
+    create = watch.InotifyWatcher
+    create(*_setup(maketemp())).close()
+  except watch.InotifyUnavailableError:
+    return
+  check_watcher(create)
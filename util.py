@@ -4,6 +4,7 @@ module author: Andrew Stucki
 
 import errno
 import os
+import contextlib
 
 def mkdir(*a, **kw):
   """
@@ -28,3 +29,55 @@ def unlink(*a):
   Wrapper for the unlink function
   """
   os.unlink(*a)
+
+def replace_file(path):
+  """
+  Context manager yielding a temporary path next to ``path``, renamed
+  over ``path`` when the block completes and removed when it raises,
+  so readers see either the old or the new file
+  """
+  tmp = '%s.%d.tmp' % (path, os.getpid())
+  if os.path.exists(tmp):
+    unlink(tmp)
+  try:
+    yield tmp
+    os.rename(tmp, path)
+  except:
+    if os.path.exists(tmp):
+      unlink(tmp)
+    raise
+replace_file = contextlib.contextmanager(replace_file)
+
+def write_file(path, mode='wb'):
+  """
+  Context manager yielding a file open on a temporary file that is
+  flushed, synced and renamed over ``path`` when the block completes
+  """
+  with replace_file(path) as tmp:
+    out = open(tmp, mode)
+    try:
+      yield out
+      out.flush()
+      os.fsync(out.fileno())
+    finally:
+      out.close()
+write_file = contextlib.contextmanager(write_file)
+
+def connect_db(path):
+  """
+  Opens an sqlite database returning text as str, transactions are
+  handled explicitly
+  """
+  import sqlite3
+  db = sqlite3.connect(path)
+  db.text_factory = str
+  db.isolation_level = None
+  return db
+
+def to_str(value):
+  """
+  Returns a value read from JSON as str, unicode is encoded as UTF-8
+  """
+  if isinstance(value, unicode):
+    return value.encode('utf-8')
+  return str(value)
@@ -0,0 +1,213 @@
+"""
+module author: Andrew Stucki
+"""
+
+import os
+import errno
+import time
+import select
+import struct
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+class WatchError(Exception):
+  """
+  Base class for watcher errors
+  """
+
+class InotifyUnavailableError(WatchError):
+  """
+  The inotify system calls could not be used
+  """
+
+def is_key_file(name,):
+  """
+  Returns whether a change to name in the key directory matters,
+  dot files are skipped like readKeys does.
+  """
+  return not name.startswith('.') and name.endswith('.pub')
+
+class InotifyWatcher:
+  """
+  Watches the key directory and the configuration file through inotify.
+  The directory holding the configuration file is watched, as the file
+  is replaced by a rename on every write.
+  """
+
+  def __init__(self,keydir,conf,):
+    """
+    Initialization method
+    """
+    try:
+      import ctypes
+      import ctypes.util
+      libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',use_errno=True)
+      self.__fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (ImportError,OSError,AttributeError), e:
+      raise InotifyUnavailableError("Unable to use inotify: %s" % e)
+    if self.__fd < 0:
+      raise InotifyUnavailableError("Unable to use inotify: %s" % os.strerror(ctypes.get_errno()))
+    self.__filters = {}
+    (conf_dir,conf_name) = os.path.split(os.path.abspath(conf))
+    for (path,accept) in ((keydir,is_key_file),(conf_dir,lambda name: name == conf_name)):
+      wd = libc.inotify_add_watch(self.__fd,path,_WATCH_MASK)
+      if wd < 0:
+        error = ctypes.get_errno()
+        os.close(self.__fd)
+        raise InotifyUnavailableError("Unable to watch '%s': %s" % (path,os.strerror(error)))
+      self.__filters.setdefault(wd,[]).append(accept)
+
+  # Public instance methods
+
+  def wait(self,timeout=None,):
+    """
+    Blocks until something relevant changed, returning True, or until
+    timeout seconds passed, returning False.
+    """
+    deadline = None
+    if timeout is not None:
+      deadline = time.time() + timeout
+    while True:
+      if deadline is not None:
+        timeout = max(0,deadline - time.time())
+      try:
+        (readable,_,_) = select.select([self.__fd],[],[],timeout)
+      except select.error, e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+      if not readable:
+        return False
+      if self.__read_events():
+        return True
+
+  def close(self,):
+    os.close(self.__fd)
+
+  # Private instance methods
+
+  def __read_events(self,):
+    """
+    Drains the pending events, returns whether any of them matters.
+    """
+    relevant = False
+    while True:
+      try:
+        data = os.read(self.__fd,65536)
+      except OSError, e:
+        if e.errno == errno.EAGAIN:
+          return relevant
+        if e.errno == errno.EINTR:
+          continue
+        raise
+      offset = 0
+      while offset < len(data):
+        (wd,mask,cookie,length) = _EVENT.unpack_from(data,offset)
+        offset += _EVENT.size
+        name = data[offset:offset + length].rstrip('\0')
+        offset += length
+        if mask & IN_Q_OVERFLOW:
+          relevant = True
+        else:
+          for accept in self.__filters.get(wd,()):
+            if accept(name):
+              relevant = True
+
+class PollingWatcher:
+  """
+  Watches the key directory and the configuration file by comparing
+  their stat information every interval seconds, for systems without
+  inotify.
+  """
+
+  def __init__(self,keydir,conf,interval=1.0,):
+    """
+    Initialization method
+    """
+    self.keydir = keydir
+    self.conf = conf
+    self.interval = interval
+    self.__state = self.__scan()
+
+  # Public instance methods
+
+  def wait(self,timeout=None,):
+    """
+    Blocks until something relevant changed, returning True, or until
+    timeout seconds passed, returning False.
+    """
+    deadline = None
+    if timeout is not None:
+      deadline = time.time() + timeout
+    while True:
+      state = self.__scan()
+      if state != self.__state:
+        self.__state = state
+        return True
+      if deadline is None:
+        time.sleep(self.interval)
+      else:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return False
+        time.sleep(min(self.interval,remaining))
+
+  def close(self,):
+    pass
+
+  # Private instance methods
+
+  def __scan(self,):
+    """
+    Returns the stat information of everything being watched
+    """
+    state = {}
+    for name in os.listdir(self.keydir):
+      if is_key_file(name):
+        state[name] = self.__stat(os.path.join(self.keydir,name))
+    state[None] = self.__stat(self.conf)
+    return state
+
+  def __stat(self,path,):
+    try:
+      st = os.stat(path)
+    except OSError, e:
+      if e.errno == errno.ENOENT:
+        return None
+      raise
+    return (st.st_ino,st.st_size,st.st_mtime)
+
+def create_watcher(keydir,conf,):
+  """
+  Returns an InotifyWatcher, or a PollingWatcher where inotify cannot
+  be used.
+  """
+  try:
+    return InotifyWatcher(keydir,conf)
+  except InotifyUnavailableError:
+    return PollingWatcher(keydir,conf)
+
+def watch(watcher,callback,debounce=1.0,max_delay=None,):
+  """
+  Calls callback once for every burst of changes, a burst ends when
+  nothing changed for debounce seconds or after max_delay seconds.
+  """
+  while True:
+    watcher.wait()
+    started = time.time()
+    while watcher.wait(debounce):
+      if max_delay is not None and time.time() - started >= max_delay:
+        break
+    callback()